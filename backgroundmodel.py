@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+
+# Models the table depth as a low-order polynomial surface z = sum(c_ij * x^i * y^j) with i + j <= order,
+# in normalized image coordinates. The surface is refit incrementally from the pixels that are known to be free
+# table, so that slow drift (thermal changes, auto-exposure, a slightly bumped table) is followed without restarting.
+class PlaneBackground:
+    def __init__(self, depth_background, order=1, refit_interval=30, decay=0.9, sample_step=8, max_residual_mm=20, occupied_border=15):
+        self.h, self.w = depth_background.shape
+        self.terms = [(i, j) for i in range(order + 1) for j in range(order + 1 - i)]
+        self.refit_interval = refit_interval
+        self.decay = decay
+        self.max_residual_mm = max_residual_mm
+        self.occupied_border = occupied_border
+        self.last_refit_frame = 0
+
+        # Normalized coordinates of every pixel (for evaluation) and of the sampling grid (for fitting)
+        self.x = np.linspace(-1, 1, self.w)
+        self.y = np.linspace(-1, 1, self.h)
+        self.sample_ys, self.sample_xs = np.mgrid[sample_step // 2:self.h:sample_step, sample_step // 2:self.w:sample_step]
+        self.sample_design = self.__design(self.x[self.sample_xs].ravel(), self.y[self.sample_ys].ravel())
+
+        # Initial fit from the calibration snapshot
+        samples = depth_background[self.sample_ys, self.sample_xs].ravel().astype(np.float64)
+        valid = samples > 0
+        a = self.sample_design[valid]
+        self.ata = a.T.dot(a) / len(a)
+        self.atb = a.T.dot(samples[valid]) / len(a)
+        self.coefficients = np.linalg.lstsq(self.ata, self.atb, rcond=None)[0]
+        self.depth_background = self.evaluate()
+
+    def __design(self, xs, ys):
+        return np.stack([xs ** i * ys ** j for i, j in self.terms], axis=1)
+
+    # Render the surface as a uint16 depth background (in mm)
+    def evaluate(self):
+        surface = np.zeros((self.h, self.w))
+        for (i, j), c in zip(self.terms, self.coefficients):
+            surface += c * np.outer(self.y ** j, self.x ** i)
+        return np.rint(np.clip(surface, 0, np.iinfo(np.uint16).max)).astype(np.uint16)
+
+    # Refit the surface from the raw depth once refit_interval frames have passed since the last refit. frame is the
+    # sequence number of the current frame, as update may not be called for every frame (e.g. when the background update
+    # is scheduled less often). occupied_masks are uint8 masks of pixels that are not free table (hand, shapes, ...).
+    # Returns True iff depth_background has been updated.
+    def update(self, depth_raw, occupied_masks, frame):
+        if 0 <= frame - self.last_refit_frame < self.refit_interval:  # A negative difference: the source was rewound
+            return False
+        self.last_refit_frame = frame
+
+        occupied = np.zeros((self.h, self.w), np.uint8)
+        for mask in occupied_masks:
+            if mask is not None:
+                cv2.bitwise_or(occupied, mask, dst=occupied)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * self.occupied_border + 1, 2 * self.occupied_border + 1))
+        occupied = cv2.dilate(occupied, kernel)
+
+        samples = depth_raw[self.sample_ys, self.sample_xs].ravel().astype(np.float64)
+        predicted = self.sample_design.dot(self.coefficients)
+        free = (occupied[self.sample_ys, self.sample_xs].ravel() == 0) & (samples > 0) & \
+               (np.abs(samples - predicted) < self.max_residual_mm)  # Reject whatever the masks missed
+        if np.count_nonzero(free) < 4 * len(self.terms):
+            return False
+
+        # Exponentially forget old observations so that the surface follows slow drift
+        a = self.sample_design[free]
+        self.ata = self.decay * self.ata + (1 - self.decay) * a.T.dot(a) / len(a)
+        self.atb = self.decay * self.atb + (1 - self.decay) * a.T.dot(samples[free]) / len(a)
+        self.coefficients = np.linalg.lstsq(self.ata, self.atb, rcond=None)[0]
+        self.depth_background = self.evaluate()
+        return True
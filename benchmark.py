@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import time
+startup_ts = time.time()
+
+import argparse
+import numpy as np
+from conf import *
+import extensions
+from framesource import open_recording, SyntheticSource
+from syntheticscene import SyntheticScene
+
+
+# Feeds a recorded session (or a synthetic scene) through the pipeline without visualization and reports the throughput
+#   unthrottled: process frames as fast as possible
+#   realtime:    process frames at a fixed frame rate
+#   recorded:    process frames following their recorded timestamps
+class Pacer:
+    def __init__(self, mode, fps):
+        self.mode = mode
+        self.fps = fps
+        self.start = None
+        self.first_timestamp = None
+        self.n = 0
+
+    def on_frame_acquired(self, _, data):
+        now = time.time()
+        if self.start is None:
+            self.start = now
+            self.first_timestamp = data['capture_timestamp']
+        if self.mode == 'realtime':
+            due = self.start + self.n / self.fps
+        elif self.mode == 'recorded' and data['capture_timestamp'] is not None:
+            due = self.start + data['capture_timestamp'] - self.first_timestamp
+        else:
+            due = now
+        self.n += 1
+        if due > now:
+            time.sleep(due - now)
+
+
+# Measures the number of frames from the finger touching (releasing) the table to the finger_down (finger_up) event.
+# Contact is taken from the ground truth of a synthetic scene, otherwise from the unfiltered fingertip height observed
+# in every frame. Events are matched to the nearest change of contact within max_frames (negative: the event came early).
+class TouchLatency:
+    def __init__(self, scene=None, max_frames=15):
+        self.scene = scene
+        self.max_frames = max_frames
+        self.in_contact = False
+        self.contact_frames = {'finger_down': [], 'finger_up': []}
+        self.event_frames = {'finger_down': [], 'finger_up': []}
+
+    def on_finger_event(self, event, _):
+        self.event_frames[event].append(controller().frame)
+
+    # Call after every processed frame
+    def on_frame_processed(self):
+        if self.scene is not None:
+            contact = self.scene.finger_in_contact
+        else:
+            contact = handdetector().hand_cnt is not None and handdetector().hand_valid and \
+                      handdetector().observed_fingertip_height < conf()['finger_down_threshold']
+        if contact and not self.in_contact:
+            self.contact_frames['finger_down'].append(controller().frame)
+        if not contact and self.in_contact:
+            self.contact_frames['finger_up'].append(controller().frame)
+        self.in_contact = contact
+
+    def report(self):
+        lines = []
+        for event in ['finger_down', 'finger_up']:
+            events = list(self.event_frames[event])
+            latencies = []
+            for frame in self.contact_frames[event]:
+                candidates = [e for e in events if abs(e - frame) <= self.max_frames]
+                if len(candidates) > 0:
+                    matched = min(candidates, key=lambda e: abs(e - frame))
+                    events.remove(matched)
+                    latencies.append(matched - frame)
+            missed = len(self.contact_frames[event]) - len(latencies)
+            if len(latencies) > 0:
+                lines.append("{:<12} {} changes of contact, latency mean {:.2f} frames, min {}, max {}, {} missed, {} spurious".format(
+                    event, len(self.contact_frames[event]), np.mean(latencies), min(latencies), max(latencies), missed, len(events)))
+            else:
+                lines.append("{:<12} {} changes of contact, {} missed, {} spurious".format(event, len(self.contact_frames[event]), missed, len(events)))
+        return "\n".join(lines)
+
+
+with Conf():
+    # The pipeline modules may only be imported once the Cython modules are ready
+    extensions.prepare(conf()['compile_pyx_on_startup'])
+    from controller import controller
+    from realsensecam import realsensecam
+    from touchetmanager import touchetmanager
+    from handdetector import handdetector
+    from handtracker import handtracker
+
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-i', '--video-input',
+                        help="File name of the raw recording or the video pair to replay")
+    source.add_argument('-s', '--synthetic', choices=['idle', 'touch', 'drag', 'rotate', 'all'],
+                        help="Use a synthetic scene playing the given script instead of a recording")
+    parser.add_argument('--shapes', type=int, default=5,
+                        help="Number of shapes in the synthetic scene")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Number of times the synthetic script is played")
+    parser.add_argument('-p', '--pacing', choices=['unthrottled', 'realtime', 'recorded'], default='unthrottled',
+                        help="How fast frames are fed into the pipeline")
+    parser.add_argument('--fps', type=float, default=30,
+                        help="Frame rate used for realtime pacing")
+    parser.add_argument('-n', '--frames', type=int,
+                        help="Stop after this many frames")
+    parser.add_argument('-w', '--warmup', type=int, default=0,
+                        help="Number of initial frames excluded from the measurements")
+    args = parser.parse_args()
+
+    scene = None
+    if args.synthetic is not None:
+        scene = SyntheticScene(num_shapes=args.shapes, script=args.synthetic, repeat=args.repeat)
+        source = SyntheticSource(scene)
+    else:
+        source = open_recording(args.video_input)
+    realsensecam(source)
+    print("Source: {} ({}x{} @ {:.1f} fps{})".format(type(source).__name__, source.W, source.H, source.fps,
+                                                 ", {} frames".format(len(source)) if source.seekable else ""))
+
+    controller(None, True)
+    touchetmanager().send_events = False
+    pacer = Pacer(args.pacing, args.fps)
+    controller().subscribe('frame_acquired', pacer.on_frame_acquired)
+    touch_latency = TouchLatency(scene)
+    handtracker().subscribe('finger_down', touch_latency.on_finger_event)
+    handtracker().subscribe('finger_up', touch_latency.on_finger_event)
+
+    measured_frames = 0
+    while args.frames is None or controller().frame < args.frames:
+        if controller().frame == args.warmup:
+            controller().timer.clear()
+            start = time.perf_counter()
+        if controller().next_frame() is None:
+            break
+        touch_latency.on_frame_processed()
+        if controller().frame == 1:
+            print("Time to first frame: {:.2f} s".format(time.time() - startup_ts))
+        if controller().frame > args.warmup:
+            measured_frames += 1
+    elapsed = time.perf_counter() - start if measured_frames > 0 else 0
+    realsensecam().stop()
+
+    print("Processed {} frames ({} warmup) with {} pacing".format(measured_frames, args.warmup, args.pacing))
+    if measured_frames > 0:
+        print("{:.3f} s, {:.1f} FPS, {:.3f} ms per frame".format(elapsed, measured_frames / elapsed, 1000 * elapsed / measured_frames))
+        print(controller().timer.report(measured_frames))
+    print("Touch latency ({}, {} filter):".format("ground truth" if scene is not None else "observed height", conf()['fingertip_filter']))
+    print(touch_latency.report())
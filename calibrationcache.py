@@ -0,0 +1,41 @@
+import os
+import json
+import numpy as np
+
+
+# Stores the depth background and the table height of a camera in <directory>/<serial number>.npz, together with the
+# stream settings they were captured with. As the camera must not move, the calibration stays valid across restarts as
+# long as the scene still looks like the cached background.
+class CalibrationCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def filename(self, serial):
+        return os.path.join(self.directory, "{}.npz".format(serial))
+
+    # Returns (depth_background, max_dist_mm) or None if there is no cached calibration for these stream settings
+    def load(self, serial, stream_settings):
+        try:
+            with np.load(self.filename(serial)) as cached:
+                if json.loads(str(cached['stream_settings'])) != stream_settings:
+                    print("Calibration cache was created with different stream settings, ignoring it")
+                    return None
+                return cached['depth_background'], int(cached['max_dist_mm'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, serial, stream_settings, depth_background, max_dist_mm):
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(self.filename(serial),
+                 depth_background=depth_background,
+                 max_dist_mm=max_dist_mm,
+                 stream_settings=json.dumps(stream_settings))
+
+    # Returns True iff at most max_mismatch (fraction of pixels) of the live depth deviates from the background by more
+    # than tolerance_mm. Pixels without depth information (0) are ignored.
+    @staticmethod
+    def matches(depth_background, depth, tolerance_mm, max_mismatch):
+        valid = depth > 0
+        deviation = np.abs(depth_background.astype(np.int32) - depth)
+        mismatch = np.count_nonzero((deviation > tolerance_mm) & valid) / max(1, np.count_nonzero(valid))
+        return mismatch <= max_mismatch
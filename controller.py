@@ -1,7 +1,3 @@
-import os
-import cv2
-
-from conf import conf
 from publisher import Publisher
 from realsensecam import realsensecam
 from shapedetector import shapedetector
@@ -10,12 +6,15 @@ from shapetracker import shapetracker
 from touchedshapetracker import touchedshapetracker
 from handdetector import handdetector
 from handtracker import handtracker
+from motiondetector import motiondetector
+from scheduler import scheduler
 from visualizer import visualizer
 from shapepicker import shapepicker
 from shaperegionpicker import shaperegionpicker
 from shapepositionpicker import shapepositionpicker
 from ui import ui
 from logger import Logger
+from stagetimer import StageTimer
 
 __controller_instance = None
 
@@ -28,13 +27,13 @@ def controller(*init_params):
 
 
 class Controller(Publisher):
-    def __init__(self, logger=None):
+    # In headless mode, next_frame does not render the visualization and returns True instead of an image
+    def __init__(self, logger=None, headless=False):
         super().__init__()
-        if conf()['compile_pyx_on_startup']:
-            os.system("python setup.py build_ext --inplace")
-
         self.frame = 0
         self.logger = logger
+        self.headless = headless
+        self.timer = StageTimer()
 
         # Initialize all needed modules
         shapedetector()
@@ -42,6 +41,8 @@ class Controller(Publisher):
         touchedshapetracker()
         handdetector()
         handtracker()
+        motiondetector()
+        scheduler()
         visualizer()
         ui()
         shapepicker()
@@ -65,17 +66,39 @@ class Controller(Publisher):
         self.frame += 1
         self.publish('frame_begins', {'frame': self.frame})
 
-        if not realsensecam().acquire_frames():
-            return None
+        with self.timer.measure('acquire'):
+            if not realsensecam().acquire_frames():
+                return None
+        self.publish('frame_acquired', {'frame': self.frame, 'capture_timestamp': realsensecam().frame_timestamp})
 
-        handdetector().determine_hand_cnt()
-        if handtracker().update() and not ui().menu_active:
-            detected_shapes = shapedetector().detect_shapes()
-            shapetracker().process_detected_shapes(detected_shapes)
-            touchedshapetracker().update()
+        with self.timer.measure('motion_detection'):
+            motiondetector().update()
+        with self.timer.measure('hand_detection'):
+            handdetector().determine_hand_cnt()
+        with self.timer.measure('hand_tracking'):
+            hand_ok = handtracker().update()
+        scheduler().update(any(shape.state == 'fresh' for shape in shapetracker().shapes.values()))
+        # The stages after shape detection work on its mask, so it also runs whenever one of them is due
+        if hand_ok and not ui().menu_active:
+            touched_shape_tracking_due = scheduler().due('touched_shape_tracking')
+            background_update_due = scheduler().due('background_update')
+            if scheduler().due('shape_detection', touched_shape_tracking_due or background_update_due):
+                with self.timer.measure('shape_detection'):
+                    detected_shapes = shapedetector().detect_shapes()
+                with self.timer.measure('shape_tracking'):
+                    shapetracker().process_detected_shapes(detected_shapes)
+            if touched_shape_tracking_due:
+                with self.timer.measure('touched_shape_tracking'):
+                    touchedshapetracker().update()
+            if background_update_due:
+                with self.timer.measure('background_update'):
+                    realsensecam().update_background(handdetector().most_recent_mask, shapedetector().most_recent_mask)
         if self.logger is not None:
             self.logger.logAll()
-        return visualizer().visualize()
+        if self.headless:
+            return True
+        with self.timer.measure('visualize'):
+            return visualizer().visualize()
 
     def on_key(self, key):
         ui().on_key(key)
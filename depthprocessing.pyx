@@ -0,0 +1,28 @@
+# cython: boundscheck=False, wraparound=False, initializedcheck=False
+
+# Fused depth preprocessing used in realsensecam.py. Replaces the following numpy expression without any temporaries:
+#     depth = background - raw (0 where raw is further away than the background)
+#     depth[depth > max_dist_mm] = max_dist_mm
+#     out = (depth * (255 / max_dist_mm)).astype(np.uint8)
+def subtract_background(const unsigned short[:, ::1] background, const unsigned short[:, ::1] raw, int max_dist_mm,
+                        unsigned char[:, ::1] out):
+    cdef Py_ssize_t h = raw.shape[0]
+    cdef Py_ssize_t w = raw.shape[1]
+    cdef Py_ssize_t y, x
+    cdef unsigned int b, r, d
+    cdef unsigned int max_dist = max_dist_mm
+    cdef double scale_by = 255.0 / max_dist_mm
+
+    if background.shape[0] != h or background.shape[1] != w or out.shape[0] != h or out.shape[1] != w:
+        raise ValueError("Background, raw depth and output must have the same size")
+
+    with nogil:
+        for y in range(h):
+            for x in range(w):
+                b = background[y, x]
+                r = raw[y, x]
+                d = b - r if b > r else 0  # Saturate uint16 underflows at 0
+                if d > max_dist:
+                    d = max_dist
+                out[y, x] = <unsigned char>(d * scale_by)
+    return out
@@ -0,0 +1,79 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import subprocess
+import importlib.abc
+import importlib.machinery
+import importlib.util
+
+
+# Handles the Cython modules (*.pyx) of this project:
+# - They are only rebuilt when the content of a .pyx file has changed since the last successful build
+# - If a compiled module is missing, modules written in plain Python syntax are loaded from their .pyx source instead
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+HASH_FILE = os.path.join(DIRECTORY, '.pyx_hashes.json')
+
+
+def pyx_modules():
+    return {os.path.splitext(os.path.basename(f))[0]: f for f in glob.glob(os.path.join(DIRECTORY, '*.pyx'))}
+
+
+def is_compiled(name):
+    return any(glob.glob(os.path.join(DIRECTORY, name + suffix)) for suffix in importlib.machinery.EXTENSION_SUFFIXES)
+
+
+def pyx_hashes():
+    hashes = {}
+    for name, filename in pyx_modules().items():
+        with open(filename, 'rb') as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+# Runs "setup.py build_ext --inplace" iff a .pyx file changed or its compiled module is missing
+def build_if_changed():
+    try:
+        with open(HASH_FILE, 'r') as f:
+            built_hashes = json.load(f)
+    except (OSError, ValueError):
+        built_hashes = {}
+    hashes = pyx_hashes()
+    outdated = [name for name, h in hashes.items() if built_hashes.get(name) != h or not is_compiled(name)]
+    if len(outdated) == 0:
+        return True
+
+    print("Building Cython modules:", ", ".join(sorted(outdated)))
+    result = subprocess.run([sys.executable, 'setup.py', 'build_ext', '--inplace'], cwd=DIRECTORY)
+    if result.returncode != 0:
+        print("Warning: Building the Cython modules failed, falling back to pure Python where possible")
+        return False
+    with open(HASH_FILE, 'w') as f:
+        json.dump(hashes, f, indent=2)
+    return True
+
+
+# Meta path finder that is consulted after the regular ones, i.e. only if no compiled module was found
+class PyxSourceFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        filename = pyx_modules().get(name)
+        if filename is None:
+            return None
+        try:
+            with open(filename, 'r') as f:
+                compile(f.read(), filename, 'exec')
+        except SyntaxError:
+            return None  # Uses Cython syntax, can only be imported when compiled
+        print("Warning: Module {} is not compiled, using the (slower) pure Python version".format(name))
+        loader = importlib.machinery.SourceFileLoader(name, filename)
+        return importlib.util.spec_from_file_location(name, filename, loader=loader)
+
+
+# Call this before any module of the pipeline is imported
+def prepare(compile_on_startup):
+    if compile_on_startup:
+        build_if_changed()
+    if not any(isinstance(f, PyxSourceFinder) for f in sys.meta_path):
+        sys.meta_path.append(PyxSourceFinder())
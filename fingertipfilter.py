@@ -0,0 +1,130 @@
+import numpy as np
+
+from conf import conf
+
+
+# Estimators of the fingertip state (its height above the table, optionally also its position) from the noisy per-frame
+# observations. Every filter is fed one observation per frame with update(observed, dt) and returns the estimate;
+# predict(frames) extrapolates the estimate by the given number of frames, which lets the hand tracker anticipate
+# contact and release. Observations may be scalars or numpy arrays.
+#   ema:     exponential moving average (no prediction), the original behavior
+#   oneeuro: One Euro filter, smooths strongly while the finger rests and follows quickly when it moves
+#   kalman:  constant velocity Kalman filter (per component)
+def create_fingertip_filter(name=None):
+    name = name or conf()['fingertip_filter']
+    if name == 'ema':
+        return EmaFilter(conf()['fingertip_filter_ema_alpha'])
+    if name == 'oneeuro':
+        return OneEuroFilter(conf()['fingertip_filter_oneeuro_min_cutoff'], conf()['fingertip_filter_oneeuro_beta'])
+    if name == 'kalman':
+        return KalmanFilter(conf()['fingertip_filter_kalman_process_noise'], conf()['fingertip_filter_kalman_measurement_noise'])
+    raise ValueError("Unknown fingertip filter {}".format(name))
+
+
+class EmaFilter:
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.dt = None
+
+    def update(self, observed, dt):
+        self.dt = dt
+        if self.value is None:
+            self.value = observed
+        else:
+            self.value = self.alpha * observed + (1 - self.alpha) * self.value
+        return self.value
+
+    def predict(self, frames):
+        return self.value
+
+
+# Casiez et al., "1€ Filter: A Simple Speed-based Low-pass Filter for Noisy Input in Interactive Systems", CHI 2012
+class OneEuroFilter:
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.velocity = None
+        self.dt = None
+
+    @staticmethod
+    def __alpha(cutoff, dt):
+        tau = 1 / (2 * np.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    def update(self, observed, dt):
+        self.dt = dt
+        observed = np.asarray(observed, np.float64)
+        if self.value is None:
+            self.value = observed
+            self.velocity = np.zeros_like(observed)
+            return self.value
+        # Smooth the velocity, then let it adapt the cutoff of the value: the faster, the less smoothing (and lag)
+        a_d = self.__alpha(self.d_cutoff, dt)
+        self.velocity = a_d * (observed - self.value) / dt + (1 - a_d) * self.velocity
+        cutoff = self.min_cutoff + self.beta * np.abs(self.velocity)
+        a = self.__alpha(cutoff, dt)
+        self.value = a * observed + (1 - a) * self.value
+        return self.value
+
+    def predict(self, frames):
+        if self.value is None:
+            return None
+        return self.value + self.velocity * self.dt * frames
+
+
+class KalmanFilter:
+    # process_noise: standard deviation of the acceleration (units per s^2)
+    # measurement_noise: standard deviation of the observations (units)
+    def __init__(self, process_noise=2000.0, measurement_noise=2.0):
+        self.q = process_noise ** 2
+        self.r = measurement_noise ** 2
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.velocity = None
+        self.dt = None
+
+    def update(self, observed, dt):
+        self.dt = dt
+        observed = np.asarray(observed, np.float64)
+        if self.value is None:
+            self.value = observed
+            self.velocity = np.zeros_like(observed)
+            # Covariance [[p_xx, p_xv], [p_xv, p_vv]], one per component
+            self.p_xx = np.full_like(observed, self.r)
+            self.p_xv = np.zeros_like(observed)
+            self.p_vv = np.full_like(observed, self.r / dt ** 2)
+            return self.value
+
+        # Predict with constant velocity, the acceleration is the process noise
+        self.value = self.value + self.velocity * dt
+        p_xx = self.p_xx + dt * (2 * self.p_xv + dt * self.p_vv) + self.q * dt ** 4 / 4
+        p_xv = self.p_xv + dt * self.p_vv + self.q * dt ** 3 / 2
+        p_vv = self.p_vv + self.q * dt ** 2
+
+        # Correct with the observation
+        s = p_xx + self.r
+        k_x = p_xx / s
+        k_v = p_xv / s
+        innovation = observed - self.value
+        self.value = self.value + k_x * innovation
+        self.velocity = self.velocity + k_v * innovation
+        self.p_xx = (1 - k_x) * p_xx
+        self.p_xv = (1 - k_x) * p_xv
+        self.p_vv = p_vv - k_v * p_xv
+        return self.value
+
+    def predict(self, frames):
+        if self.value is None:
+            return None
+        return self.value + self.velocity * self.dt * frames
@@ -0,0 +1,125 @@
+import os
+import cv2
+import numpy as np
+
+from rawrecording import RawRecordingReader, EXTENSION as RAW_EXTENSION
+
+
+# Interface of everything RealsenseCam can get its frames from. A source declares its native resolution and frame
+# rate, whether it supports seeking and what kind of depth it delivers:
+#   raw_depth = True:  the aligned depth in mm (uint16). The source also provides the depth_background and max_dist_mm
+#                      that RealsenseCam needs for the background subtraction.
+#   raw_depth = False: the depth has already been preprocessed (uint8, 0 = table, 255 = max_dist_mm above it)
+class FrameSource:
+    def __init__(self, w, h, fps, seekable=False, raw_depth=True):
+        self.W = w
+        self.H = h
+        self.fps = fps
+        self.seekable = seekable
+        self.raw_depth = raw_depth
+        self.depth_background = None
+        self.max_dist_mm = None
+
+    # Returns (sequence number, capture timestamp in seconds, bgr, depth) of the next frame or None if there is none.
+    # The returned arrays may be reused by the source once the next frame is read.
+    def read(self):
+        raise NotImplementedError
+
+    # Number of frames, only available for seekable sources
+    def __len__(self):
+        raise TypeError("{} has no length".format(type(self).__name__))
+
+    # Continue with frame i (0-based) on the next read, only available for seekable sources
+    def seek(self, i):
+        raise NotImplementedError("{} does not support seeking".format(type(self).__name__))
+
+    def stop(self):
+        pass
+
+
+# A pair of mp4 videos (see videowriter.py) containing the bgr frames and the preprocessed depth
+class Mp4Source(FrameSource):
+    def __init__(self, bgr_filename, depth_filename):
+        self.stream_bgr = cv2.VideoCapture(bgr_filename)
+        self.stream_depth = cv2.VideoCapture(depth_filename)
+        if not self.stream_bgr.isOpened() or not self.stream_depth.isOpened():
+            raise IOError("Could not open {} and {}".format(bgr_filename, depth_filename))
+        super().__init__(int(self.stream_bgr.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.stream_bgr.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         self.stream_bgr.get(cv2.CAP_PROP_FPS) or 30, seekable=True, raw_depth=False)
+        self.depth = np.zeros((self.H, self.W), np.uint8)
+        self.seq = 0
+
+    def read(self):
+        ret, bgr = self.stream_bgr.read()
+        ret_depth, depth_bgr = self.stream_depth.read()
+        if not ret or not ret_depth:
+            return None
+        self.seq += 1
+        timestamp = self.stream_bgr.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        cv2.cvtColor(depth_bgr, cv2.COLOR_BGR2GRAY, dst=self.depth)
+        return self.seq, timestamp, bgr, self.depth
+
+    def __len__(self):
+        return int(min(self.stream_bgr.get(cv2.CAP_PROP_FRAME_COUNT), self.stream_depth.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+    def seek(self, i):
+        self.stream_bgr.set(cv2.CAP_PROP_POS_FRAMES, i)
+        self.stream_depth.set(cv2.CAP_PROP_POS_FRAMES, i)
+        self.seq = i
+
+    def stop(self):
+        self.stream_bgr.release()
+        self.stream_depth.release()
+
+
+# A raw recording (see rawrecording.py). The background and the table height are restored as they were captured.
+class RawRecordingSource(FrameSource):
+    def __init__(self, filename):
+        self.recording = RawRecordingReader(filename)
+        timestamps = self.recording.timestamps
+        fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0]) if len(timestamps) > 1 and timestamps[-1] > timestamps[0] else 30
+        super().__init__(self.recording.w, self.recording.h, fps, seekable=True)
+        self.depth_background = self.recording.depth_background
+        self.max_dist_mm = self.recording.max_dist_mm
+        self.index = 0
+
+    def read(self):
+        if self.index >= len(self.recording):
+            return None
+        frame = self.recording.read(self.index)
+        self.index += 1
+        return frame
+
+    def __len__(self):
+        return len(self.recording)
+
+    def seek(self, i):
+        self.index = i
+
+    def stop(self):
+        self.recording.close()
+
+
+# A SyntheticScene (see syntheticscene.py), rendered on the fly
+class SyntheticSource(FrameSource):
+    def __init__(self, scene):
+        super().__init__(scene.w, scene.h, scene.fps)
+        self.scene = scene
+        self.depth_background = scene.depth_background
+        self.max_dist_mm = scene.max_dist_mm
+
+    def read(self):
+        rendered = self.scene.render()
+        if rendered is None:
+            return None
+        bgr, depth, timestamp = rendered
+        return self.scene.frame, timestamp, bgr, depth
+
+
+# Opens the recording with the given name: a raw recording (name.tcraw) if it exists, else the video pair
+# name_rgb.mp4 / name_depth.mp4
+def open_recording(name):
+    raw_filename = name if name.endswith(RAW_EXTENSION) else name + RAW_EXTENSION
+    if os.path.exists(raw_filename):
+        return RawRecordingSource(raw_filename)
+    return Mp4Source("{}_rgb.mp4".format(name), "{}_depth.mp4".format(name))
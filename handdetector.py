@@ -1,10 +1,10 @@
 import cv2
 import numpy as np
-from scipy.spatial.distance import cdist
 
 from publisher import Publisher
 from conf import conf
 from realsensecam import realsensecam
+from fingertipfilter import create_fingertip_filter
 
 
 __handdetector_instance = None
@@ -22,65 +22,64 @@ class HandDetector(Publisher):
         super().__init__()
         self.hand_cnt = None
         self.hand_valid = True
-        self.fingertip_height = np.inf
+        self.fingertip_height = np.inf  # Filtered height of the fingertip (in depth_blurred units)
+        self.fingertip_height_predicted = np.inf  # Filtered height, extrapolated by finger_prediction_frames
+        self.observed_fingertip_height = np.inf  # Height of the fingertip in the current frame
+        self.height_filter = create_fingertip_filter()
+        self.position_filter = create_fingertip_filter() if conf()['fingertip_filter_position'] else None
+        self.last_frame_timestamp = None
         self.secondary_hand_cnts = []
+        self.hand_masks = {}  # Cache of hand_mask(), cleared for every frame
+
+        # Region (x, y, w, h) of the current hand, the finger detection only looks at it
+        self.hand_roi = (0, 0, realsensecam().W, realsensecam().H)
 
     def determine_hand_cnt(self):
+        self.hand_cnt = None
+        self.secondary_hand_cnts = []
+        self.hand_masks = {}
+        self.hand_valid = True
+
         # Cut along the table surface to get all objects lying above it
         _, depth_th_hand = cv2.threshold(realsensecam().depth_blurred, conf()['hand_depth_threshold'], 255, cv2.THRESH_BINARY)
         self.most_recent_mask = depth_th_hand
 
-        # Detect the contours, the largest is assumed to be the hand
-        self.hand_cnt = None
-        self.secondary_hand_cnts = []
-        self.hand_valid = True
+        # Detect the contours, the largest is assumed to be the hand. The whole frame is searched, so that other hands
+        # and objects end up in secondary_hand_cnts wherever they are.
         contours, _ = cv2.findContours(depth_th_hand, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if len(contours) > 0:
             sorted_cnts = sorted(contours, key=lambda c: -cv2.contourArea(c))
-            if cv2.contourArea(sorted_cnts[0]) > 500:  # Largest contour is the hand
+            min_area = realsensecam().scale_area(500)
+            if cv2.contourArea(sorted_cnts[0]) > min_area:  # Largest contour is the hand
                 self.hand_cnt = sorted_cnts[0]
             for cnt in sorted_cnts[1:]:  # Other large contours will be saved as secondary hands
-                if cv2.contourArea(cnt) < 500:
+                if cv2.contourArea(cnt) < min_area:
                     break
                 self.secondary_hand_cnts.append(cnt)
         if self.hand_cnt is None:
+            self.hand_roi = (0, 0, realsensecam().W, realsensecam().H)
             return  # No hand detected
+        # Padded by one pixel so that the contours of the slices are found exactly as in the full frame
+        self.hand_roi = self.__padded_region(cv2.boundingRect(self.hand_cnt), 1)
 
         # The following code is used to find out where the hand enters the camera
 
         # Initialize / reset datastructures
-        touched_corners = set()  # This will hold the edges of the frame that are touched by the hand
-        self.edgepts = []
         self.edgeextrem1 = None
         self.edgeextrem2 = None
         self.edgeextremcenter = None
 
         # Detect points touching an edge and account which edges are touched
-        for pt in self.hand_cnt[:, 0]:
-            iscorner = False
-            if pt[1] <= 1:  # Top edge
-                touched_corners.add(0)
-                iscorner = True
-            if pt[0] <= 1:  # Left edge
-                touched_corners.add(1)
-                iscorner = True
-            if pt[1] >= realsensecam().H - 1:  # Bottom edge
-                touched_corners.add(2)
-                iscorner = True
-            if pt[0] >= realsensecam().W - 1:  # Right edge
-                touched_corners.add(3)
-                iscorner = True
-            if iscorner:  # If the point has touched an edge, add it to edgepts
-                self.edgepts.append(pt)
+        on_edge = self.__edge_masks(self.hand_cnt)
+        touched_corners = np.any(on_edge, axis=1)  # This will hold the edges of the frame that are touched by the hand
+        self.edgepts = self.hand_cnt[np.any(on_edge, axis=0), 0]
 
         # Make sure that top and bottom (or left and right) edge are not touched simultaneously
-        for i in touched_corners:
-            for j in touched_corners:
-                if i != j and i % 2 == j % 2:
-                    # In this case, the hand is larger than the recorded area and we cannot infer anything
-                    self.hand_valid = False
-                    print("Hand error: Too long hand")
-                    return
+        if (touched_corners[0] and touched_corners[2]) or (touched_corners[1] and touched_corners[3]):
+            # In this case, the hand is larger than the recorded area and we cannot infer anything
+            self.hand_valid = False
+            print("Hand error: Too long hand")
+            return
 
         # Detect where the hand is touching the edge(s)
         if len(self.edgepts) < 2:
@@ -88,21 +87,20 @@ class HandDetector(Publisher):
             print("Hand error: Edge points detection failed")
             return
         # Find the two points touching an edge that are furthest apart, as well as their center
-        pairwise_1_norm_dists = cdist(self.edgepts, self.edgepts, 'cityblock')
-        furthest_pts = np.unravel_index(np.argmax(pairwise_1_norm_dists), pairwise_1_norm_dists.shape)
-        self.edgeextrem1 = tuple(self.edgepts[furthest_pts[0]])
-        self.edgeextrem2 = tuple(self.edgepts[furthest_pts[1]])
+        i, j = self.__furthest_pair_1_norm(self.edgepts)
+        self.edgeextrem1 = tuple(self.edgepts[i])
+        self.edgeextrem2 = tuple(self.edgepts[j])
         self.edgeextremcenter = (int((self.edgeextrem1[0] + self.edgeextrem2[0]) / 2), int((self.edgeextrem1[1] + self.edgeextrem2[1]) / 2))
 
         # The following code is for finger detection
 
         # Acquire slice
-        slice_img = self.__get_slice_img(3, 20)
+        slice_img, slice_offset = self.__get_slice_img(conf()['finger_slice_lowest_layer'], conf()['finger_slice_layers'], self.hand_roi)
         if slice_img is None:
             self.hand_valid = False
             print("Hand error: Invalid slice img")
             return
-        slice_cnts, _ = cv2.findContours(slice_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        slice_cnts, _ = cv2.findContours(slice_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=slice_offset)
         if len(slice_cnts) == 0:
             self.hand_valid = False
             print("Hand error: Invalid slice contours")
@@ -110,13 +108,13 @@ class HandDetector(Publisher):
 
         # Get furthest point from arm entry point
         cnts_arr = np.concatenate(slice_cnts)[:, 0]
-        dists = cdist(cnts_arr, [self.edgeextremcenter])
-        furthest_pt = cnts_arr[np.argmax(dists, axis=0)][0]
+        dists = np.linalg.norm(cnts_arr - np.array(self.edgeextremcenter), axis=1)
+        furthest_pt = cnts_arr[np.argmax(dists)]
         self.fingertip_pos = tuple(furthest_pt)
 
         # Calculate height of fingertip
-        x = self.fingertip_pos[0]
-        y = self.fingertip_pos[1]
+        x = furthest_pt[0]
+        y = furthest_pt[1]
         r = conf()['finger_height_measure_radius']
         left = max(0, x - r)
         top = max(0, y - r)
@@ -124,63 +122,174 @@ class HandDetector(Publisher):
         bottom = min(realsensecam().H, y + r)
         # Let the highest pixel of that surface be the fingertip height
         cropped = realsensecam().depth_blurred[top:bottom, left:right]
-        observed_height = np.max(cropped)
-        if self.fingertip_height == np.inf:
-            self.fingertip_height = observed_height
-        else:
-            self.fingertip_height = 0.5 * observed_height + 0.5 * self.fingertip_height
+        self.observed_fingertip_height = np.max(cropped)
+
+        # Filter height (and position) of the fingertip over time
+        dt = self.__frame_interval()
+        self.fingertip_height = self.height_filter.update(self.observed_fingertip_height, dt)
+        self.fingertip_height_predicted = self.height_filter.predict(conf()['finger_prediction_frames'])
+        if self.position_filter is not None:
+            filtered_pos = self.position_filter.update(furthest_pt, dt)
+            self.fingertip_pos = (int(round(filtered_pos[0])), int(round(filtered_pos[1])))
+
+    # Time (in seconds) since the previous frame the fingertip was seen in
+    def __frame_interval(self):
+        timestamp = realsensecam().frame_timestamp
+        last_timestamp = self.last_frame_timestamp
+        self.last_frame_timestamp = timestamp
+        if timestamp is None or last_timestamp is None or timestamp <= last_timestamp:
+            return 1 / realsensecam().source.fps
+        return timestamp - last_timestamp
+
+    # Returns a 4 x n boolean array telling for every point of the contour whether it lies on the
+    # top (0), left (1), bottom (2) or right (3) edge of the frame
+    @staticmethod
+    def __edge_masks(cnt):
+        pts = cnt[:, 0]
+        return np.stack((pts[:, 1] <= 1, pts[:, 0] <= 1, pts[:, 1] >= realsensecam().H - 1, pts[:, 0] >= realsensecam().W - 1))
+
+    # Returns the indices (i, j) of the two points that are furthest apart in 1-norm, in linear time. Ties are broken
+    # like argmax on the pairwise distance matrix would (smallest i, then smallest j).
+    # With u = x + y and v = x - y, the 1-norm distance is max(|du|, |dv|), so the largest distance of any point is
+    # to the extremes of u or v.
+    @staticmethod
+    def __furthest_pair_1_norm(pts):
+        pts = pts.astype(np.int64)
+        u = pts[:, 0] + pts[:, 1]
+        v = pts[:, 0] - pts[:, 1]
+        furthest = np.max([u - u.min(), u.max() - u, v - v.min(), v.max() - v], axis=0)
+        i = np.argmax(furthest)
+        dists = np.abs(pts - pts[i]).sum(axis=1)
+        return i, np.argmax(dists == furthest[i])
+
+    # The hand contour(s) of the current frame, filled and grown by hand_shape_intersection_border, as a uint8 mask.
+    # It is drawn once per frame and shared by all intersection queries.
+    def hand_mask(self, include_secondary_contours=True):
+        mask = self.hand_masks.get(include_secondary_contours)
+        if mask is None:
+            mask = np.zeros((realsensecam().H, realsensecam().W), np.uint8)
+            contours_to_check = [self.hand_cnt]
+            if include_secondary_contours:
+                contours_to_check += self.secondary_hand_cnts
+            cv2.drawContours(mask, contours_to_check, -1, 255, -1)
+            cv2.drawContours(mask, contours_to_check, -1, 255, conf()['hand_shape_intersection_border'])
+            self.hand_masks[include_secondary_contours] = mask
+        return mask
 
     # Returns true iff the passed OpenCV contour intersects with the save hand contour.
     def cnt_intersects_with_hand(self, cnt, include_secondary_contours=True):
         if self.hand_cnt is None:
             return False
 
-        # Create two empty frames, draw the contours and perform bitwise and
-        hand_img = np.zeros((realsensecam().H, realsensecam().W, 1), np.uint8)
-        cnt_img = hand_img.copy()
-        contours_to_check = [self.hand_cnt]
-        if include_secondary_contours:
-            contours_to_check += self.secondary_hand_cnts
-        cv2.drawContours(hand_img, contours_to_check, -1, 255, -1)
-        cv2.drawContours(hand_img, contours_to_check, -1, 255, conf()['hand_shape_intersection_border'])
-        cv2.drawContours(cnt_img, [cnt], 0, 255, cv2.FILLED)
-        anded = np.bitwise_and(hand_img, cnt_img)
+        # Only the bounding box of the contour needs to be looked at
+        x, y, w, h = cv2.boundingRect(cnt)
+        left = max(0, x)
+        top = max(0, y)
+        right = min(realsensecam().W, x + w)
+        bottom = min(realsensecam().H, y + h)
+        if right <= left or bottom <= top:
+            return False
+        hand_roi = self.hand_mask(include_secondary_contours)[top:bottom, left:right]
+        if not np.any(hand_roi):
+            return False
+
+        # Draw the contour and perform bitwise and with the hand mask
+        cnt_img = np.zeros_like(hand_roi)
+        cv2.drawContours(cnt_img, [cnt], 0, 255, cv2.FILLED, offset=(-left, -top))
+        anded = np.bitwise_and(hand_roi, cnt_img)
 
         # If there are non-zero pixels left after "and"ing, there is an intersection
         return np.any(anded)
 
+    # Batched version of cnt_intersects_with_hand for single points: returns a boolean array telling for each of the
+    # (x, y) points whether it lies on the hand. Coordinates are truncated to int, points outside the frame are False.
+    def points_in_hand(self, pts, include_secondary_contours=True):
+        pts = np.asarray(pts).reshape(-1, 2).astype(int)
+        result = np.zeros(len(pts), bool)
+        if self.hand_cnt is None:
+            return result
+        inside = (pts[:, 0] >= 0) & (pts[:, 0] < realsensecam().W) & (pts[:, 1] >= 0) & (pts[:, 1] < realsensecam().H)
+        mask = self.hand_mask(include_secondary_contours)
+        result[inside] = mask[pts[inside, 1], pts[inside, 0]] > 0
+        return result
+
     def on_hand_exit(self, *_):
         self.fingertip_height = np.inf
+        self.fingertip_height_predicted = np.inf
+        self.observed_fingertip_height = np.inf
+        self.height_filter.reset()
+        if self.position_filter is not None:
+            self.position_filter.reset()
+        self.last_frame_timestamp = None
 
-    def __get_layer_cnt(self, layer):
-        _, depth_th = cv2.threshold(realsensecam().depth_blurred, layer, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(depth_th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Returns the largest contour of the pixels higher than layer, looking only at the (x, y, w, h) region of the
+    # blurred depth (which must contain all of them), as well as the bounding box of these pixels
+    @staticmethod
+    def __get_layer_cnt(layer, region):
+        x, y, w, h = region
+        _, depth_th = cv2.threshold(realsensecam().depth_blurred[y:y + h, x:x + w], layer, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(depth_th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
         if len(contours) > 0:
-            return max(contours, key=lambda c: cv2.contourArea(c))
+            bx, by, bw, bh = cv2.boundingRect(depth_th)
+            return max(contours, key=lambda c: cv2.contourArea(c)), (x + bx, y + by, bw, bh)
         else:
-            return None
+            return None, None
 
-    def __get_slice_img(self, lowest_layer, highest_layer):
+    # Draws the start and end points of the convexity defects of the largest contour of every depth layer
+    # (finger_slice_layers layers starting at finger_slice_lowest_layer) and closes them to blobs.
+    # The layers are nested (every layer is a subset of the one below), so they are walked upwards:
+    # - Each layer only looks at the bounding box of the layer below, padded by one pixel so that contours are found
+    #   exactly as in the full frame
+    # - A layer is skipped if it contains the same pixels as the one below (as it would yield the same markers), which
+    #   is known from the histogram of the lowest layer's region
+    # - Once a layer is empty, all layers above are as well
+    # Only the given region is considered. Returns the region of the marker image that contains markers (or the empty
+    # region) and its offset in the frame.
+    def __get_slice_img(self, lowest_layer, num_layers, region):
         marker_points = []
-        for i in range(lowest_layer, highest_layer):
-            largest_cnt = self.__get_layer_cnt(i)
-            if largest_cnt is not None:
-                hull = cv2.convexHull(largest_cnt, returnPoints=False)
-                defects = cv2.convexityDefects(largest_cnt, hull)
-
-                if defects is None:
-                    continue
-
-                for i in range(defects.shape[0]):
-                    s, e, f, d = defects[i, 0]
-                    start = tuple(largest_cnt[s][0])
-                    end = tuple(largest_cnt[e][0])
-                    far = tuple(largest_cnt[f][0])
-                    marker_points.append(start)
-                    marker_points.append(end)
-
-        marker_img = np.zeros((realsensecam().H, realsensecam().W), np.uint8)
-        for op in marker_points:
-            cv2.circle(marker_img, op, 1, 255, -1)
-        marker_img = cv2.morphologyEx(marker_img, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15)))
-        return marker_img
+        depth_blurred = realsensecam().depth_blurred
+        hist = None
+        for layer in range(lowest_layer, min(lowest_layer + num_layers, 255)):  # Nothing is higher than 255
+            if hist is not None:
+                if hist[layer] == 0:
+                    continue  # No pixel has this exact value, i.e. the layer is identical to the one below
+                if not np.any(hist[layer + 1:]):
+                    break  # This and all higher layers are empty
+            largest_cnt, bbox = self.__get_layer_cnt(layer, region)
+            if largest_cnt is None:
+                break
+            region = self.__padded_region(bbox, 1)
+            if hist is None:
+                x, y, w, h = region
+                hist = np.bincount(depth_blurred[y:y + h, x:x + w].ravel(), minlength=256)
+
+            hull = cv2.convexHull(largest_cnt, returnPoints=False)
+            defects = cv2.convexityDefects(largest_cnt, hull)
+
+            if defects is None:
+                continue
+
+            # Start and end points of the defects
+            marker_points.append(largest_cnt[defects[:, 0, :2].ravel(), 0])
+
+        if len(marker_points) == 0:
+            return np.zeros((0, 0), np.uint8), (0, 0)
+        marker_points = np.concatenate(marker_points)
+
+        # Grow every point to a circle of radius 1 (a cross) and close the markers to blobs. Both only affect pixels
+        # within the kernel sizes of the points, so only that region of the marker image is drawn.
+        x, y, w, h = self.__padded_region(cv2.boundingRect(marker_points), 16)
+        marker_img = np.zeros((h, w), np.uint8)
+        marker_img[marker_points[:, 1] - y, marker_points[:, 0] - x] = 255
+        cv2.dilate(marker_img, cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3)), dst=marker_img)
+        cv2.morphologyEx(marker_img, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15)), dst=marker_img)
+        return marker_img, (x, y)
+
+    @staticmethod
+    def __padded_region(bbox, padding):
+        x, y, w, h = bbox
+        left = max(0, x - padding)
+        top = max(0, y - padding)
+        right = min(realsensecam().W, x + w + padding)
+        bottom = min(realsensecam().H, y + h + padding)
+        return left, top, right - left, bottom - top
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-from scipy import optimize
 
 import icp
 from publisher import Publisher
@@ -54,9 +53,13 @@ class HandTracker(Publisher):
         if not now_visible and was_visible:
             self.publish('hand_exit', None)
 
-        # Check if finger is down or not
-        now_down = handdetector().fingertip_height < conf()['finger_height_threshold']
+        # Check if finger is down or not. The thresholds differ for touching and releasing (hysteresis), both are
+        # applied to the height predicted finger_prediction_frames ahead to anticipate the change.
         was_down = self.finger_down
+        if was_down:
+            now_down = handdetector().fingertip_height_predicted < conf()['finger_up_threshold']
+        else:
+            now_down = handdetector().fingertip_height_predicted < conf()['finger_down_threshold']
         self.finger_down = now_down
 
         if now_down and not was_down:
@@ -65,7 +68,7 @@ class HandTracker(Publisher):
             data = {'fingertip_pos': self.enhanced_fingertip_pos(), 'finger_delta': self.finger_delta, 'finger_deg_delta': self.finger_deg_delta}
             self.publish('finger_down', data)
             touchetmanager().emit_global_event('finger_down', data)
-            for shape in shapetracker().shapes.values():
+            for shape in shapetracker().shapes_at(data['fingertip_pos']):
                 shape.on_finger_down(data)  # The shape will figure out if it is the target
 
         if not now_down and was_down:
@@ -73,59 +76,79 @@ class HandTracker(Publisher):
             data = {'fingertip_pos': self.enhanced_fingertip_pos(), 'finger_delta': self.finger_delta, 'finger_deg_delta': self.finger_deg_delta}
             self.publish('finger_up', data)
             touchetmanager().emit_global_event('finger_up', data)
-            for shape in shapetracker().shapes.values():
+            for shape in shapetracker().shapes_at(data['fingertip_pos']):
                 shape.on_finger_up(data)  # The shape will figure out if it is the target
 
         if was_down and now_down:
             data = {'fingertip_pos': self.enhanced_fingertip_pos(), 'finger_delta': self.finger_delta, 'finger_deg_delta': self.finger_deg_delta}
             self.publish('finger_pressing', data)
             touchetmanager().emit_global_event('finger_pressing', data)
-            for shape in shapetracker().shapes.values():
+            for shape in shapetracker().shapes_at(data['fingertip_pos']):
                 shape.on_finger_pressing(data)  # The shape will figure out if it is the target
             if self.__update_of():  # Only trigger if the finger actually moved enough
                 self.publish('finger_moved', data)
                 touchetmanager().emit_global_event('finger_moved', data)
-                for shape in shapetracker().shapes.values():
+                for shape in shapetracker().shapes_at(data['fingertip_pos']):
                     shape.on_finger_moved(data)  # The shape will figure out if it is the target
         return True
 
+    # Optical flow only looks at a region around the tracked points, which leaves of_roi_margin for the motion of the
+    # finger. Returns the (x, y, w, h) region around the box (left, top, right, bottom) of the points.
+    @staticmethod
+    def __of_roi(left, top, right, bottom):
+        margin = realsensecam().scale_px(conf()['of_roi_margin'])
+        x = int(max(0, left - margin))
+        y = int(max(0, top - margin))
+        return x, y, int(min(realsensecam().W, right + margin + 1)) - x, int(min(realsensecam().H, bottom + margin + 1)) - y
+
+    @staticmethod
+    def __gray(roi):
+        x, y, w, h = roi
+        return cv2.cvtColor(realsensecam().bgr[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+
     def __start_of_tracking(self):
         self.of_enabled = True
 
-        self.old_gray = cv2.cvtColor(realsensecam().bgr, cv2.COLOR_BGR2GRAY)
-        mask = np.zeros((realsensecam().H, realsensecam().W), np.uint8)
-        cv2.circle(mask, handdetector().fingertip_pos, 80, 255, -1)
+        fingertip_pos = handdetector().fingertip_pos
+        radius = int(realsensecam().scale_px(80))
+        self.of_roi = self.__of_roi(fingertip_pos[0] - radius, fingertip_pos[1] - radius, fingertip_pos[0] + radius, fingertip_pos[1] + radius)
+        x, y, w, h = self.of_roi
+        self.old_gray = self.__gray(self.of_roi)
+        mask = np.zeros((h, w), np.uint8)
+        cv2.circle(mask, (int(fingertip_pos[0]) - x, int(fingertip_pos[1]) - y), radius, 255, -1)
         cnt_mask = np.zeros_like(mask)
-        cv2.drawContours(cnt_mask, [handdetector().hand_cnt], 0, 255, -1)
+        cv2.drawContours(cnt_mask, [handdetector().hand_cnt], 0, 255, -1, offset=(-x, -y))
         mask = cv2.bitwise_and(mask, cnt_mask)
 
         self.of_old_pts = p0 = cv2.goodFeaturesToTrack(self.old_gray, mask=mask, **self.of_feature_params)
         if self.of_old_pts is None:
             self.__stop_of_tracking()
             return
+        self.of_old_pts += np.array((x, y), np.float32)  # Points are kept in frame coordinates
         self.of_orig_existing_pts = self.of_old_pts.copy()
         self.of_is_fingertip = np.array([0] * len(self.of_orig_existing_pts))
 
         fingertip = np.array(handdetector().fingertip_pos)
         for i, pt in enumerate(self.of_old_pts[:, 0]):
-            if np.linalg.norm(np.array(pt) - fingertip) < 30:
+            if np.linalg.norm(np.array(pt) - fingertip) < realsensecam().scale_px(30):
                 self.of_is_fingertip[i] = 1
 
     def __update_of(self):
         if not self.of_enabled:
             return
 
-        # Calculate optical flow
-        new_gray = cv2.cvtColor(realsensecam().bgr, cv2.COLOR_BGR2GRAY)
-        new_pts, st, err = cv2.calcOpticalFlowPyrLK(self.old_gray, new_gray, self.of_old_pts, None, **self.of_lk_params)
+        # Calculate optical flow within the region of the previous frame
+        x, y, w, h = self.of_roi
+        offset = np.array((x, y), np.float32)
+        new_gray = self.__gray(self.of_roi)
+        new_pts, st, err = cv2.calcOpticalFlowPyrLK(self.old_gray, new_gray, self.of_old_pts - offset, None, **self.of_lk_params)
         if new_pts is None:
             self.__stop_of_tracking()
             return
+        new_pts += offset
 
         # Mark points that are not on the hand as invalid
-        for i, ptt in enumerate(new_pts):
-            if not handdetector().cnt_intersects_with_hand(np.array([ptt]).astype(int)):
-                st[i][0] = 0
+        st[~handdetector().points_in_hand(new_pts), 0] = 0
 
         # Delete lost points
         self.of_orig_existing_pts = self.of_orig_existing_pts[st == 1]
@@ -147,9 +170,16 @@ class HandTracker(Publisher):
         dt = np.linalg.norm(np.array(t) - np.array(old_finger_delta))
         dr = abs(old_finger_deg_delta - self.finger_deg_delta)
 
-        # Prepare next iteration
-        self.old_gray = new_gray.copy()
+        # Prepare next iteration. Once the points have used up half of the margin, the region is moved along.
         self.of_old_pts = new_pts.reshape(-1, 1, 2)
+        left, top = np.min(new_pts, axis=0)
+        right, bottom = np.max(new_pts, axis=0)
+        min_margin = realsensecam().scale_px(conf()['of_roi_margin']) / 2
+        if (x > 0 and left - x < min_margin) or (y > 0 and top - y < min_margin) or \
+                (x + w < realsensecam().W and x + w - right < min_margin) or (y + h < realsensecam().H and y + h - bottom < min_margin):
+            self.of_roi = self.__of_roi(left, top, right, bottom)
+            new_gray = self.__gray(self.of_roi)
+        self.old_gray = new_gray
         self.of_orig_existing_pts = self.of_orig_existing_pts.reshape(-1, 1, 2)
 
         return dt > 1 or dr > .3
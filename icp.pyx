@@ -2,7 +2,6 @@
 
 
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
 
 
 def best_fit_transform(A, B):
@@ -62,6 +61,7 @@ def nearest_neighbor(src, dst):
 
     assert src.shape == dst.shape
 
+    from sklearn.neighbors import NearestNeighbors  # Imported here as it is slow to load and rarely needed
     neigh = NearestNeighbors(n_neighbors=1)
     neigh.fit(dst)
     distances, indices = neigh.kneighbors(src, return_distance=True)
@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+from conf import conf
+from realsensecam import realsensecam
+
+__motiondetector_instance = None
+
+
+def motiondetector(*init_params):
+    global __motiondetector_instance
+    if __motiondetector_instance is None:
+        __motiondetector_instance = MotionDetector(*init_params)
+    return __motiondetector_instance
+
+
+# Cheap change detection on the color frames: every frame is downsampled by DOWNSAMPLING (averaging the pixels) and
+# compared to the previous one. A pixel of the downsampled frame has changed if any channel differs by more than
+# motion_threshold. Other modules can compare the downsampled frame to their own references (see changed()).
+class MotionDetector:
+    DOWNSAMPLING = 8
+
+    def __init__(self):
+        self.small = None
+        self.previous_small = None
+        self.motion = True  # Whether the scene has changed since the previous frame
+
+    def update(self):
+        self.previous_small = self.small
+        self.small = cv2.resize(realsensecam().bgr, (realsensecam().W // self.DOWNSAMPLING, realsensecam().H // self.DOWNSAMPLING),
+                                interpolation=cv2.INTER_AREA)
+        self.motion = self.previous_small is None or self.changed(self.previous_small).any()
+
+    # Boolean mask of the pixels of the downsampled frame that differ from the given reference (downsampled as well)
+    def changed(self, reference):
+        _, over = cv2.threshold(cv2.absdiff(self.small, reference), conf()['motion_threshold'], 255, cv2.THRESH_BINARY)
+        return cv2.cvtColor(over, cv2.COLOR_BGR2GRAY) > 0  # Nonzero iff any channel is over the threshold
+
+    # Boolean grid of tile x tile px tiles telling for each tile whether it contains a pixel that differs from the reference
+    def changed_tiles(self, reference, tile):
+        rows, cols = -(-realsensecam().H // tile), -(-realsensecam().W // tile)
+        return cv2.resize(self.changed(reference).astype(np.float32), (cols, rows), interpolation=cv2.INTER_AREA) > 0
+
+    # The part of the downsampled frame covering the region (x, y, x2, y2) of the full frame, as a pair of slices
+    def slices(self, rect):
+        x, y, x2, y2 = rect
+        f = self.DOWNSAMPLING
+        return slice(y // f, -(-y2 // f)), slice(x // f, -(-x2 // f))
@@ -0,0 +1,146 @@
+import json
+import struct
+import zlib
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Raw recording container (*.tcraw)
+#
+# The file is a sequence of chunks, each starting with a 16 byte header (tag, reserved, payload length) and padded
+# to a multiple of CHUNK_ALIGNMENT bytes:
+#   HEAD: JSON metadata (frame size, depth codec, max_dist_mm)
+#   BGND: the uint16 depth background snapshot, stored uncompressed
+#   FRME: frame header (sequence number, timestamp, compressed depth length), the raw bgr bitmap and the depth
+# The bgr bitmaps and the background are stored uncompressed so that replay can hand out zero-copy views into a
+# numpy.memmap. The uint16 depth is stored losslessly: row-wise delta coding, byte shuffling and zstd (or zlib if the
+# zstandard module is not available).
+
+MAGIC = b'TCRAW\x00\x01\x00'
+CHUNK_HEADER = struct.Struct('<4sIQ')
+FRAME_HEADER = struct.Struct('<QdI4x')
+CHUNK_ALIGNMENT = 64
+EXTENSION = '.tcraw'
+
+
+def default_depth_codec():
+    return 'delta-shuffle-zstd' if zstandard is not None else 'delta-shuffle-zlib'
+
+
+def encode_depth(depth, codec):
+    # Row-wise deltas (wrapping in uint16) turn the smooth depth into mostly small values, shuffling the low and high
+    # bytes into separate planes then lets the entropy coder see long runs of zeros
+    delta = np.empty_like(depth)
+    delta[:, 0] = depth[:, 0]
+    np.subtract(depth[:, 1:], depth[:, :-1], out=delta[:, 1:])
+    shuffled = delta.view(np.uint8).reshape(-1, 2).T.tobytes()
+    if codec == 'delta-shuffle-zstd':
+        return zstandard.ZstdCompressor(level=1).compress(shuffled)
+    if codec == 'delta-shuffle-zlib':
+        return zlib.compress(shuffled, 1)
+    raise ValueError("Unknown depth codec {}".format(codec))
+
+
+def decode_depth(data, codec, shape):
+    if codec == 'delta-shuffle-zstd':
+        if zstandard is None:
+            raise RuntimeError("This recording uses zstd. Please install the zstandard module to replay it.")
+        shuffled = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'delta-shuffle-zlib':
+        shuffled = zlib.decompress(data)
+    else:
+        raise ValueError("Unknown depth codec {}".format(codec))
+    delta = np.frombuffer(shuffled, np.uint8).reshape(2, -1).T.copy().view(np.uint16).reshape(shape)
+    return np.cumsum(delta, axis=1, dtype=np.uint16)
+
+
+def padding_for(length):
+    return -length % CHUNK_ALIGNMENT
+
+
+class RawRecordingWriter:
+    def __init__(self, filename, framesize, depth_background, max_dist_mm, depth_codec=None):
+        self.w, self.h = framesize
+        self.depth_codec = depth_codec or default_depth_codec()
+        self.seq = 0
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(b'\x00' * padding_for(len(MAGIC)))
+        header = {
+            'version': 1,
+            'width': self.w,
+            'height': self.h,
+            'depth_codec': self.depth_codec,
+            'max_dist_mm': int(max_dist_mm),
+        }
+        self.__write_chunk(b'HEAD', [json.dumps(header).encode('utf8')])
+        self.__write_chunk(b'BGND', [np.ascontiguousarray(depth_background, np.uint16).tobytes()])
+
+    def process_frame(self, bgr, depth_raw, timestamp):
+        self.seq += 1
+        depth_data = encode_depth(np.ascontiguousarray(depth_raw, np.uint16), self.depth_codec)
+        frame_header = FRAME_HEADER.pack(self.seq, timestamp, len(depth_data))
+        self.__write_chunk(b'FRME', [frame_header, np.ascontiguousarray(bgr, np.uint8).data, depth_data])
+
+    def stop(self):
+        self.file.close()
+
+    def __write_chunk(self, tag, parts):
+        length = sum(len(memoryview(p).cast('B')) for p in parts)
+        self.file.write(CHUNK_HEADER.pack(tag, 0, length))
+        for p in parts:
+            self.file.write(p)
+        self.file.write(b'\x00' * padding_for(CHUNK_HEADER.size + length))
+
+
+class RawRecordingReader:
+    def __init__(self, filename):
+        self.data = np.memmap(filename, np.uint8, 'r')
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("{} is not a raw recording".format(filename))
+        self.header = None
+        self.depth_background = None
+        self.frames = []  # (sequence number, timestamp, offset of bgr, offset of depth, length of depth)
+
+        # Walk the chunks once to build the frame index. A truncated last chunk (e.g. after a crash) is ignored.
+        offset = len(MAGIC) + padding_for(len(MAGIC))
+        while offset + CHUNK_HEADER.size <= len(self.data):
+            tag, _, length = CHUNK_HEADER.unpack_from(self.data, offset)
+            payload = offset + CHUNK_HEADER.size
+            if payload + length > len(self.data):
+                print("Warning: Raw recording {} is truncated".format(filename))
+                break
+            if tag == b'HEAD':
+                self.header = json.loads(bytes(self.data[payload:payload + length]).decode('utf8'))
+                self.w = self.header['width']
+                self.h = self.header['height']
+                self.depth_codec = self.header['depth_codec']
+                self.max_dist_mm = self.header['max_dist_mm']
+            elif tag == b'BGND':
+                self.depth_background = self.data[payload:payload + length].view(np.uint16).reshape(self.h, self.w)
+            elif tag == b'FRME':
+                seq, timestamp, depth_length = FRAME_HEADER.unpack_from(self.data, payload)
+                bgr_offset = payload + FRAME_HEADER.size
+                depth_offset = bgr_offset + self.h * self.w * 3
+                self.frames.append((seq, timestamp, bgr_offset, depth_offset, depth_length))
+            offset = payload + length + padding_for(CHUNK_HEADER.size + length)
+        if self.header is None or self.depth_background is None:
+            raise ValueError("{} is missing its header".format(filename))
+        self.timestamps = np.array([f[1] for f in self.frames])
+
+    def __len__(self):
+        return len(self.frames)
+
+    # Returns the sequence number, the timestamp, a zero-copy bgr view and the decoded uint16 depth of frame i
+    def read(self, i):
+        seq, timestamp, bgr_offset, depth_offset, depth_length = self.frames[i]
+        bgr = self.data[bgr_offset:depth_offset].reshape(self.h, self.w, 3)
+        depth = decode_depth(self.data[depth_offset:depth_offset + depth_length], self.depth_codec, (self.h, self.w))
+        return seq, timestamp, bgr, depth
+
+    def close(self):
+        self.data = None
@@ -1,18 +1,25 @@
-import pyrealsense2 as rs
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-from scipy import ndimage
+
+from conf import conf
+from framesource import Mp4Source
+from backgroundmodel import PlaneBackground
+
+try:
+    import depthprocessing
+except ImportError:
+    print("Warning: Module depthprocessing is not compiled, using the (slower) numpy version")
+    depthprocessing = None
 
 __realsensecam_instance = None
 
 
-def realsensecam(*init_params):
+def realsensecam(*init_params, **init_kwargs):
     global __realsensecam_instance
     if __realsensecam_instance is None:
         print("Starting camera")
         try:
-            __realsensecam_instance = RealsenseCam(*init_params)
+            __realsensecam_instance = RealsenseCam(*init_params, **init_kwargs)
         except:
             print("Could not initialize RealSense camera! Make sure it is supported by pyrealsense2. Try re-plugging it (maybe to a different USB port).")
             raise
@@ -20,96 +27,111 @@ def realsensecam(*init_params):
 
 
 class RealsenseCam:
-    W = 640
-    H = 480
-
-    # If you want to use files instead of the actual cam, you may pass an array [bgr_filename, depth_filename] as argument
-    def __init__(self, video_files=None):
-        # Initialize RealSense intrinsics
+    # Resolution the pixel constants of the pipeline (areas, radii, ...) have been tuned for, see scale_px
+    REFERENCE_W = 640
+    REFERENCE_H = 480
+
+    # Frames are taken from the given FrameSource (see framesource.py), by default the live RealSense camera.
+    # For convenience, a list [bgr_filename, depth_filename] of an mp4 video pair may be passed instead.
+    # RealsenseCam applies the shared depth preprocessing (background subtraction and blurring) on top of the source.
+    # Frames are processed in processing_resolution (config, default: the resolution of the source).
+    def __init__(self, source=None):
+        if source is None:
+            from realsensesource import RealsenseSource
+            source = RealsenseSource()
+        elif isinstance(source, (list, tuple)):
+            source = Mp4Source(*source)
+        self.source = source
+        self.W, self.H = conf()['processing_resolution'] or (source.W, source.H)
+        self.resize = (self.W, self.H) != (source.W, source.H)
+        self.scale = np.sqrt(self.W * self.H / (self.REFERENCE_W * self.REFERENCE_H))
+        self.blur_ksize = int(round(19 * self.scale)) | 1  # Must be odd
         self.diagonal = np.linalg.norm((self.W, self.H))
-        self.pipeline = rs.pipeline()
-        self.aligner = rs.align(rs.stream.color)
-        self.config = rs.config()
-        self.config.enable_stream(rs.stream.depth, 640, 360, rs.format.z16, 30)
-        self.config.enable_stream(rs.stream.color, self.W, self.H, rs.format.bgr8, 30)
-        self.temporal_filter = rs.temporal_filter()
-        self.hole_filling_filter = rs.hole_filling_filter()
-        self.from_file = video_files is not None
-        self.max_dist_mm = None
-
-        if self.from_file:
-            self.stream_bgr = cv2.VideoCapture(video_files[0])
-            self.stream_depth = cv2.VideoCapture(video_files[1])
-        else:
-            # Start up camera
-            profile = self.pipeline.start(self.config)
-
-            # Set camera options
-            sensor = profile.get_device().first_depth_sensor()
-            sensor.set_option(rs.option.enable_auto_exposure, 1)
-            # sensor.set_option(rs.option.exposure, 5000)
-
-            # Acquire an initial set of frames used for calibration
-            # Flush 10 frames to get the Intel temporal filter warmed up
-            for i in range(30):
-                self.__acquire_raw_aligned()
-
-            # Save a snapshot of the background for later subtraction, blur it for denoising purposes
-            self.__depth_background = ndimage.gaussian_filter(self.__depth_raw_aligned, 20)
-
-            # Auto-detect table height
-            self.max_dist_mm = np.max(self.__depth_background) + 100
-
-    def __acquire_raw_aligned(self):
-        frames = self.pipeline.wait_for_frames()
-        aligned_frames = self.aligner.process(frames)
-
-        # Store color bitmap from the regular sensor as a numpy array (suitable for OpenCV)
-        self.bgr = np.asanyarray(aligned_frames.get_color_frame().get_data())
-
-        # Get denoised distance bitmap of depth (larger (brighter) pixel is further from sensor)
-        # In this intermediate result, objects have different coordinates than in the bgr image
-        depth_frame = aligned_frames.get_depth_frame()
-        depth_frame = self.temporal_filter.process(depth_frame)
-        depth_frame = self.hole_filling_filter.process(depth_frame)
-        self.__depth_raw_aligned = np.asanyarray(depth_frame.get_data())
+        self.max_dist_mm = source.max_dist_mm
+        self.__depth_background = source.depth_background
+        if self.resize and self.__depth_background is not None:
+            self.__depth_background = cv2.resize(self.__depth_background, (self.W, self.H), interpolation=cv2.INTER_AREA)
+        self.__depth_raw_aligned = None
+        self.bgr = None
+        self.frame_seq = 0  # Sequence number of the most recently acquired frame
+        self.frame_timestamp = None  # Capture time (seconds) of the most recently acquired frame
+        self.background_model = None
+        # Output buffers of the depth preprocessing, reused for every frame
+        self.depth_processed = np.zeros((self.H, self.W), np.uint8)
+        self.depth_blurred = np.zeros((self.H, self.W), np.uint8)
+
+        if source.raw_depth and conf()['background_model'] == 'plane':
+            # Replace the background snapshot by a parametric model of the table that follows slow drift
+            self.background_model = PlaneBackground(self.__depth_background,
+                                                    order=conf()['background_plane_order'],
+                                                    refit_interval=conf()['background_refit_interval'],
+                                                    decay=conf()['background_refit_decay'],
+                                                    occupied_border=conf()['hand_shape_intersection_border'])
+            self.__depth_background = self.background_model.depth_background
 
     def acquire_frames(self):
-        if self.from_file:
-            ret, self.bgr = self.stream_bgr.read()
-            if not ret:
-                return False
-            self.depth_processed = cv2.cvtColor(self.stream_depth.read()[1], cv2.COLOR_BGR2GRAY)
-            self.depth_blurred = cv2.GaussianBlur(self.depth_processed, (19, 19), 0)
+        frame = self.source.read()
+        if frame is None:
+            return False
+        self.frame_seq, self.frame_timestamp, self.bgr, depth = frame
+        if self.resize:
+            self.bgr = cv2.resize(self.bgr, (self.W, self.H), interpolation=cv2.INTER_AREA)
+            depth = cv2.resize(depth, (self.W, self.H), interpolation=cv2.INTER_NEAREST)  # Do not blend holes (0) in
+
+        if self.source.raw_depth:
+            # Remove the background captured in the first picture (fill negative results with 0s), remove elements that
+            # are higher than the auto-detected maximum and convert to uint8 (as cv2 requires it later), all in one pass
+            self.__depth_raw_aligned = depth
+            if depthprocessing is not None:
+                depthprocessing.subtract_background(self.__depth_background, self.__depth_raw_aligned, int(self.max_dist_mm), self.depth_processed)
+            else:
+                self.__subtract_background_numpy()
         else:
-            # First, acquire fresh frames and retrieve the aligned but still raw depth
-            self.__acquire_raw_aligned()
-
-            # Remove the background captured in the first picture (fill negative results with 0s)
-            depth = np.zeros_like(self.__depth_raw_aligned)
-            allowed_indices = self.__depth_background > self.__depth_raw_aligned  # Find uint16 underflows
-            depth[allowed_indices] = (self.__depth_background - self.__depth_raw_aligned)[allowed_indices]
-
-            # Remove elements that are higher than the auto-detected maximum
-            depth[depth > self.max_dist_mm] = self.max_dist_mm
-
-            # For later usage, cv2 requires us to convert stuff to uint8
-            scale_by = np.iinfo(np.uint8).max / self.max_dist_mm
-            self.depth_processed = (depth * scale_by).astype(np.uint8)
-            self.depth_blurred = cv2.GaussianBlur(self.depth_processed, (19, 19), 0)
+            np.copyto(self.depth_processed, depth)
+        cv2.GaussianBlur(self.depth_processed, (self.blur_ksize, self.blur_ksize), 0, dst=self.depth_blurred)
         return True
 
+    # Scale a length (in pixels) tuned for the reference resolution to the processing resolution
+    def scale_px(self, px):
+        return px * self.scale
+
+    # Scale an area (in square pixels) tuned for the reference resolution to the processing resolution
+    def scale_area(self, px2):
+        return px2 * self.scale ** 2
+
+    # Fallback for the depthprocessing module, produces the same result
+    def __subtract_background_numpy(self):
+        depth = np.zeros_like(self.__depth_raw_aligned)
+        allowed_indices = self.__depth_background > self.__depth_raw_aligned  # Find uint16 underflows
+        depth[allowed_indices] = (self.__depth_background - self.__depth_raw_aligned)[allowed_indices]
+        depth[depth > self.max_dist_mm] = self.max_dist_mm
+        scale_by = np.iinfo(np.uint8).max / self.max_dist_mm
+        np.copyto(self.depth_processed, depth * scale_by, casting='unsafe')
+
+    # Called once the hand and shape masks of the current frame are known. Refits the background model (if any)
+    # from the pixels not covered by any of the masks.
+    def update_background(self, *occupied_masks):
+        if self.background_model is None:
+            return
+        if self.background_model.update(self.__depth_raw_aligned, occupied_masks, self.frame_seq):
+            self.__depth_background = self.background_model.depth_background
+
+    # The aligned depth before background subtraction (uint16, in mm), as needed for lossless recording
+    @property
+    def depth_raw_aligned(self):
+        return self.__depth_raw_aligned
+
+    @property
+    def depth_background(self):
+        return self.__depth_background
+
     # Show a curve visualizing the distribution of the depth across all pixels
     def visualize_depth_distribution(self):
+        import matplotlib.pyplot as plt
         x, y = np.unique(self.depth_processed, return_counts=True)
         plt.plot(x, y)
         plt.show()
 
     # You MUST call this upon program exit (even on exception), otherwise the cam will fail to start the next time.
     def stop(self):
-        if self.from_file:
-            self.stream_bgr.release()
-            self.stream_depth.release()
-        else:
-            self.pipeline.stop()
-            print("Cam stopped")
+        self.source.stop()
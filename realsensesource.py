@@ -0,0 +1,260 @@
+import pyrealsense2 as rs
+import numpy as np
+import cv2
+import threading
+import time
+
+from conf import conf
+from calibrationcache import CalibrationCache
+from framesource import FrameSource
+
+
+# Live frames of an Intel RealSense camera, aligned to the color stream and filtered.
+# If threaded is set (default: threaded_capture in the config), frames are acquired and filtered in a background thread.
+# The depth is aligned to the color stream depending on the alignment setting in the config:
+#   rs_align:      reproject every depth frame with rs.align (exact, but expensive on the CPU)
+#   static_remap:  as the camera is fixed above a flat table, the mapping from color to depth pixels is (nearly)
+#                  constant. It is computed once from the intrinsics, the extrinsics and the table depth of the
+#                  calibration and applied with cv2.remap.
+class RealsenseSource(FrameSource):
+    # The streams are configured by a stream profile (see stream_profiles in the config): resolution and frame rate of
+    # the color and the depth stream, and the magnitude of the decimation filter applied to the depth (1: none).
+    # Higher frame rates lower the touch latency, decimation makes up for the larger depth resolutions they come with.
+    def __init__(self, threaded=None, stream_profile=None):
+        stream_profile = stream_profile or conf()['stream_profile']
+        settings = conf()['stream_profiles'][stream_profile]
+        color_w, color_h, color_fps = settings['color']
+        depth_w, depth_h, depth_fps = settings['depth']
+        super().__init__(color_w, color_h, color_fps)
+        self.pipeline = rs.pipeline()
+        self.aligner = rs.align(rs.stream.color)
+        self.config = rs.config()
+        self.stream_settings = {'depth': [depth_w, depth_h, 'z16', depth_fps], 'color': [color_w, color_h, 'bgr8', color_fps],
+                                'decimation': settings['decimation']}
+        self.config.enable_stream(rs.stream.depth, depth_w, depth_h, rs.format.z16, depth_fps)
+        self.config.enable_stream(rs.stream.color, color_w, color_h, rs.format.bgr8, color_fps)
+        self.decimation_filter = None
+        if settings['decimation'] > 1:
+            self.decimation_filter = rs.decimation_filter()
+            self.decimation_filter.set_option(rs.option.filter_magnitude, settings['decimation'])
+        self.temporal_filter = rs.temporal_filter()
+        self.hole_filling_filter = rs.hole_filling_filter()
+        self.frame_seq = 0
+        self.alignment = conf()['alignment']
+        self.remap = None  # Lookup tables of static_remap, built after calibration
+        self.alignment_error = None
+        self.threaded = conf()['threaded_capture'] if threaded is None else threaded
+        self.capture_thread = None
+
+        # Start up camera
+        profile = self.pipeline.start(self.config)
+
+        # Set camera options
+        sensor = profile.get_device().first_depth_sensor()
+        sensor.set_option(rs.option.enable_auto_exposure, 1)
+        # sensor.set_option(rs.option.exposure, 5000)
+
+        serial = profile.get_device().get_info(rs.camera_info.serial_number)
+        if not conf()['calibration_cache'] or not self.__load_calibration(serial):
+            self.__calibrate()
+            if conf()['calibration_cache']:
+                CalibrationCache(conf()['calibration_cache_dir']).save(serial, self.stream_settings, self.depth_background, self.max_dist_mm)
+
+        if self.alignment == 'static_remap':
+            self.__build_remap(profile)
+            self.alignment_error = self.__measure_alignment_error(conf()['alignment_check_frames'])
+            print("Static alignment error against rs.align: mean {:.1f} mm, p95 {:.1f} mm, {:.1%} of the pixels off by more "
+                  "than {} mm".format(*self.alignment_error, conf()['calibration_tolerance_mm']))
+        elif self.alignment != 'rs_align':
+            raise ValueError("Unknown alignment {}".format(self.alignment))
+
+        if self.threaded:
+            self.__start_capture_thread()
+
+    def __calibrate(self):
+        # Acquire an initial set of frames used for calibration
+        # Flush 10 frames to get the Intel temporal filter warmed up
+        for i in range(30):
+            _, depth_raw_aligned = self.__acquire_raw_aligned()
+
+        # Save a snapshot of the background for later subtraction, blur it for denoising purposes
+        from scipy import ndimage
+        self.depth_background = ndimage.gaussian_filter(depth_raw_aligned, 20)
+
+        # Auto-detect table height
+        self.max_dist_mm = np.max(self.depth_background) + 100
+
+    # Use the cached calibration if the live frames still match it. Returns False if a full calibration is needed.
+    def __load_calibration(self, serial):
+        cached = CalibrationCache(conf()['calibration_cache_dir']).load(serial, self.stream_settings)
+        if cached is None:
+            return False
+        depth_background, max_dist_mm = cached
+        for i in range(conf()['calibration_check_frames']):
+            _, depth_raw_aligned = self.__acquire_raw_aligned()
+        if not CalibrationCache.matches(depth_background, depth_raw_aligned,
+                                        conf()['calibration_tolerance_mm'], conf()['calibration_max_mismatch']):
+            print("Scene does not match the cached calibration, recalibrating")
+            return False
+        self.depth_background = depth_background
+        self.max_dist_mm = max_dist_mm
+        print("Using cached calibration of camera", serial)
+        return True
+
+    # Build the color to depth pixel lookup tables of static_remap. Every color pixel is deprojected at the depth of the
+    # table (i.e. objects on the table are slightly misaligned, the higher the more), transformed into the depth
+    # camera and projected onto the depth image. Lens distortion is ignored.
+    def __build_remap(self, profile):
+        color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color = color_profile.get_intrinsics()
+        depth_frame = self.pipeline.wait_for_frames().get_depth_frame()
+        if self.decimation_filter is not None:
+            depth_frame = self.decimation_filter.process(depth_frame)
+        depth = depth_frame.profile.as_video_stream_profile().get_intrinsics()  # Of the decimated frames
+        extrinsics = color_profile.get_extrinsics_to(depth_profile)
+        rotation = np.array(extrinsics.rotation).reshape(3, 3).T  # librealsense stores it column-major
+        translation = np.array(extrinsics.translation)
+        depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+
+        # Table depth (in m) for every color pixel, invalid pixels of the background get the median
+        table = self.depth_background.astype(np.float64)
+        table[table == 0] = np.median(table[table > 0])
+        table *= depth_scale
+
+        us, vs = np.meshgrid(np.arange(self.W, dtype=np.float64), np.arange(self.H, dtype=np.float64))
+        points = np.stack(((us - color.ppx) / color.fx * table, (vs - color.ppy) / color.fy * table, table))
+        points = np.tensordot(rotation, points, axes=1) + translation[:, None, None]
+        map_x = (points[0] / points[2] * depth.fx + depth.ppx).astype(np.float32)
+        map_y = (points[1] / points[2] * depth.fy + depth.ppy).astype(np.float32)
+        self.remap = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2, nninterpolation=True)
+
+        # The temporal filter now sees depth frames of a different resolution, start over
+        self.temporal_filter = rs.temporal_filter()
+
+    def __remap_depth(self, depth_frame):
+        return cv2.remap(np.asanyarray(depth_frame.get_data()), self.remap[0], self.remap[1], cv2.INTER_NEAREST,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    # Compare static_remap against rs.align on unfiltered frames.
+    # Returns the mean and 95th percentile of the absolute depth difference (mm) and the share of pixels that differ by
+    # more than calibration_tolerance_mm (including pixels that are only valid in one of both).
+    def __measure_alignment_error(self, frames):
+        errors = []
+        mismatches = 0
+        total = 0
+        for i in range(frames):
+            frameset = self.__decimate(self.pipeline.wait_for_frames())
+            reference = np.asanyarray(self.aligner.process(frameset).get_depth_frame().get_data()).astype(np.int32)
+            remapped = self.__remap_depth(frameset.get_depth_frame()).astype(np.int32)
+            valid = (reference > 0) & (remapped > 0)
+            error = np.abs(reference - remapped)[valid]
+            errors.append(error)
+            mismatches += np.count_nonzero(error > conf()['calibration_tolerance_mm']) + np.count_nonzero((reference > 0) != (remapped > 0))
+            total += reference.size
+        errors = np.concatenate(errors)
+        if len(errors) == 0:
+            return float('nan'), float('nan'), 1.0
+        return float(np.mean(errors)), float(np.percentile(errors, 95)), mismatches / total
+
+    def __acquire_raw_aligned(self):
+        return self.__align_and_filter(self.pipeline.wait_for_frames())
+
+    # Decimate the depth of a frameset, before aligning it (which is then cheaper as well)
+    def __decimate(self, frames):
+        if self.decimation_filter is None:
+            return frames
+        return self.decimation_filter.process(frames).as_frameset()
+
+    def __align_and_filter(self, frames):
+        frames = self.__decimate(frames)
+        if self.remap is not None:
+            # The depth is filtered in its own resolution, then looked up for every color pixel
+            depth_frame = self.temporal_filter.process(frames.get_depth_frame())
+            depth_frame = self.hole_filling_filter.process(depth_frame)
+            return np.asanyarray(frames.get_color_frame().get_data()), self.__remap_depth(depth_frame)
+
+        aligned_frames = self.aligner.process(frames)
+
+        # Store color bitmap from the regular sensor as a numpy array (suitable for OpenCV)
+        bgr = np.asanyarray(aligned_frames.get_color_frame().get_data())
+
+        # Get denoised distance bitmap of depth (larger (brighter) pixel is further from sensor)
+        # In this intermediate result, objects have different coordinates than in the bgr image
+        depth_frame = aligned_frames.get_depth_frame()
+        depth_frame = self.temporal_filter.process(depth_frame)
+        depth_frame = self.hole_filling_filter.process(depth_frame)
+        return bgr, np.asanyarray(depth_frame.get_data())
+
+    def __start_capture_thread(self):
+        # Double buffer: the producer fills the back slot, then flips it to the front. Only references are swapped,
+        # so a frame handed out to the tracking pipeline is never overwritten while it is being processed.
+        self.capture_slots = [None, None]
+        self.capture_front = 0
+        self.capture_seq = self.frame_seq
+        self.capture_error = None
+        self.last_stall_warning = 0
+        self.capture_condition = threading.Condition()
+        self.capture_thread = threading.Thread(target=self.__capture_loop, name="RealsenseCapture", daemon=True)
+        self.capture_thread.stop = False
+        self.capture_thread.start()
+
+    # Runs in the capture thread: acquire, align and filter frames as fast as the camera delivers them
+    def __capture_loop(self):
+        t = threading.current_thread()
+        while not t.stop:
+            try:
+                success, frames = self.pipeline.try_wait_for_frames(conf()['capture_timeout_ms'])
+                if not success:
+                    continue
+                bgr, depth_raw_aligned = self.__align_and_filter(frames)
+            except Exception as e:  # Handed over to the tracking thread, which stops
+                with self.capture_condition:
+                    self.capture_error = e
+                    self.capture_condition.notify_all()
+                return
+            timestamp = time.time()
+            back = 1 - self.capture_front
+            self.capture_slots[back] = (self.capture_seq + 1, timestamp, bgr, depth_raw_aligned)
+            with self.capture_condition:
+                self.capture_front = back
+                self.capture_seq += 1
+                self.capture_condition.notify_all()
+
+    # Fetch the newest completed frame from the capture thread without waiting for a new one (the same frame may be
+    # returned again if the pipeline is faster than the camera). Only the first frame is waited for, returns None if
+    # the camera does not deliver it within capture_timeout_ms or if the capture thread failed. A stalled camera is
+    # reported at most once every capture_timeout_ms.
+    def __read_from_capture_thread(self):
+        timeout = conf()['capture_timeout_ms'] / 1000
+        with self.capture_condition:
+            ready = lambda: self.capture_slots[self.capture_front] is not None or self.capture_error is not None
+            if not self.capture_condition.wait_for(ready, timeout):
+                print("Warning: Camera did not deliver a frame within {} ms".format(conf()['capture_timeout_ms']))
+            if self.capture_error is not None:
+                print("Capture thread failed:", self.capture_error)
+                return None
+            frame = self.capture_slots[self.capture_front]
+        if frame is None:
+            return None
+        now = time.time()
+        if now - frame[1] > timeout and now - self.last_stall_warning > timeout:
+            print("Warning: Camera did not deliver a new frame for {:.0f} ms".format(1000 * (now - frame[1])))
+            self.last_stall_warning = now
+        self.frame_seq = frame[0]
+        return frame
+
+    def read(self):
+        if self.threaded:
+            return self.__read_from_capture_thread()
+        bgr, depth_raw_aligned = self.__acquire_raw_aligned()
+        self.frame_seq += 1
+        return self.frame_seq, time.time(), bgr, depth_raw_aligned
+
+    # You MUST call this upon program exit (even on exception), otherwise the cam will fail to start the next time.
+    def stop(self):
+        if self.capture_thread is not None:
+            self.capture_thread.stop = True
+            self.capture_thread.join()
+        self.pipeline.stop()
+        print("Cam stopped")
@@ -1,24 +1,44 @@
 #!/usr/bin/env python
 
+import time
+startup_ts = time.time()
+
 import cv2
 import argparse
 from conf import *
-from controller import controller
-from realsensecam import realsensecam
+import extensions
 from videowriter import VideoWriter
-from logger import Logger
+from rawrecording import RawRecordingWriter, EXTENSION as RAW_EXTENSION
+from framesource import open_recording, SyntheticSource
+from syntheticscene import SyntheticScene
 
 
 def filename_from_name(name):
     return "{}_rgb.mp4".format(name), "{}_depth.mp4".format(name)
 
 
+def raw_filename_from_name(name):
+    return name if name.endswith(RAW_EXTENSION) else name + RAW_EXTENSION
+
+
 with Conf():
+    # The pipeline modules may only be imported once the Cython modules are ready
+    extensions.prepare(conf()['compile_pyx_on_startup'])
+    from controller import controller
+    from realsensecam import realsensecam
+    from logger import Logger
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-o', '--video-output',
-                        help="File name for storing the camera feed as a video")
+                        help="File name for storing the camera feed as a raw recording (or as a video pair with --mp4)")
     parser.add_argument('-i', '--video-input',
-                        help="File name of the video pair used instead of the camera feed")
+                        help="File name of the raw recording or the video pair used instead of the camera feed")
+    parser.add_argument('-s', '--synthetic', choices=['idle', 'touch', 'drag', 'rotate', 'all'],
+                        help="Use a synthetic scene playing the given script instead of the camera feed")
+    parser.add_argument('--shapes', type=int, default=5,
+                        help="Number of shapes in the synthetic scene")
+    parser.add_argument('--mp4', action='store_true',
+                        help="Record the camera feed as a lossy mp4 video pair instead of a raw recording")
     parser.add_argument('-b' '--breakpoints', nargs='+', type=int,
                         help="Pause at the specified frames and wait for a key to be pressed")
     parser.add_argument('-l', '--logfile')
@@ -27,10 +47,15 @@ with Conf():
     if args.video_output is not None and args.video_input is not None:
         print("Error: You may not use -i and -o simultaneously. Please use only up to one of them at a time.")
         exit(-1)
+    if args.synthetic is not None and args.video_input is not None:
+        print("Error: You may not use -i and -s simultaneously. Please use only up to one of them at a time.")
+        exit(-1)
 
     # Initialize camera
     if args.video_input is not None:
-        realsensecam(list(filename_from_name(args.video_input)))
+        realsensecam(open_recording(args.video_input))
+    elif args.synthetic is not None:
+        realsensecam(SyntheticSource(SyntheticScene(num_shapes=args.shapes, script=args.synthetic)))
     else:
         realsensecam()
 
@@ -41,7 +66,11 @@ with Conf():
     controller(logger)
 
     if args.video_output is not None:
-        videowriter = VideoWriter(*filename_from_name(args.video_output), 30, (realsensecam().W, realsensecam().H), threaded=False)
+        if args.mp4:
+            videowriter = VideoWriter(*filename_from_name(args.video_output), realsensecam().source.fps, (realsensecam().W, realsensecam().H), threaded=False)
+        else:
+            videowriter = RawRecordingWriter(raw_filename_from_name(args.video_output), (realsensecam().W, realsensecam().H),
+                                             realsensecam().depth_background, realsensecam().max_dist_mm)
 
     breakpoints = args.b__breakpoints or []
     while(True):
@@ -49,6 +78,8 @@ with Conf():
         if img is None:
             print("Controller reports end of capture. Terminating.")
             break
+        if controller().frame == 1:
+            print("Time to first frame: {:.2f} s".format(time.time() - startup_ts))
         cv2.imshow('DynamicUIs', img)
         k = cv2.waitKey(1)
         if ord('q') == k:
@@ -56,7 +87,10 @@ with Conf():
         else:
             controller().on_key(k)
         if args.video_output is not None:
-            videowriter.process_frame(realsensecam().bgr, realsensecam().depth_processed)
+            if args.mp4:
+                videowriter.process_frame(realsensecam().bgr, realsensecam().depth_processed)
+            else:
+                videowriter.process_frame(realsensecam().bgr, realsensecam().depth_raw_aligned, realsensecam().frame_timestamp)
         if controller().frame in breakpoints:
             print("Paused at breakpoint", controller().frame)
             print("Press Space to advance by a single frame")
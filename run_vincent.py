@@ -1,12 +1,15 @@
 import cv2
 from conf import *
-from controller import controller
-from realsensecam import realsensecam
+import extensions
 
 NAME = 'sample_videos/test'
 
 if __name__ == "__main__":
     with Conf():
+        extensions.prepare(conf()['compile_pyx_on_startup'])
+        from controller import controller
+        from realsensecam import realsensecam
+
         # Initialize camera
         realsensecam(list((NAME + '_rgb.mp4', NAME + '_depth.mp4')))
         # Initialize controller
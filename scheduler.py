@@ -0,0 +1,62 @@
+import time
+
+from conf import conf
+from handdetector import handdetector
+from handtracker import handtracker
+from motiondetector import motiondetector
+
+__scheduler_instance = None
+
+
+def scheduler(*init_params):
+    global __scheduler_instance
+    if __scheduler_instance is None:
+        __scheduler_instance = Scheduler(*init_params)
+    return __scheduler_instance
+
+
+# Decides which of the optional pipeline stages run in the current frame. Every stage runs every n frames, where n is
+# configured per activity state of the scene (see schedule in the config):
+#   pressing: a finger is down, or the scene is settling (e.g. fresh shapes are waiting for their confirmation, which
+#             counts shape detections)
+#   hover:    a hand is present (or the scene changes without one)
+#   idle:     no hand and the scene has not changed for scheduler_idle_frames frames
+# Any motion ends the idle state immediately, and stages that are overdue for the new state run right away.
+class Scheduler:
+    def __init__(self):
+        self.state = 'hover'
+        self.frames_since_motion = 0
+        self.frames_since_run = {stage: float('inf') for stage in conf()['schedule']}
+        self.run_timestamps = {stage: [] for stage in conf()['schedule']}  # Of the last second, to measure the rates
+
+    # Call once per frame, after the hand has been tracked. settling tells whether something has to be observed closely
+    # although nothing may move (e.g. a fresh shape waiting for confirmation).
+    def update(self, settling=False):
+        if motiondetector().motion or settling or handdetector().hand_cnt is not None:
+            self.frames_since_motion = 0
+        else:
+            self.frames_since_motion += 1
+
+        if handtracker().finger_down or settling:
+            self.state = 'pressing'
+        elif handdetector().hand_cnt is not None or self.frames_since_motion < conf()['scheduler_idle_frames']:
+            self.state = 'hover'
+        else:
+            self.state = 'idle'
+        for stage in self.frames_since_run:
+            self.frames_since_run[stage] += 1
+
+    # Whether the stage is due in the current frame. If it is, it is expected to run. needed tells that the stage has to
+    # run anyway (e.g. because a later stage depends on it), which counts as a run as well.
+    def due(self, stage, needed=False):
+        if not needed and self.frames_since_run[stage] < conf()['schedule'][stage][self.state]:
+            return False
+        self.frames_since_run[stage] = 0
+        now = time.time()
+        self.run_timestamps[stage] = [t for t in self.run_timestamps[stage] if now - t < 1] + [now]
+        return True
+
+    # Number of runs of the stage within the last second
+    def rate(self, stage):
+        now = time.time()
+        return sum(1 for t in self.run_timestamps[stage] if now - t < 1)
@@ -4,6 +4,7 @@ import numpy as np
 import icp
 from publisher import Publisher
 from bbox import Bbox
+from shapedescriptor import shape_differences
 from realsensecam import realsensecam
 from shapetracker import shapetracker
 from handdetector import handdetector
@@ -12,35 +13,15 @@ import transformationutils
 
 
 class Shape(Publisher):
-    def __init__(self, cnt):
+    # Creates a tracked shape from a DetectedShape (see shapedetector.py)
+    def __init__(self, detected_shape):
         super().__init__()
-
-        # Calculate the bbox
-        bbox = Bbox(*cv2.boundingRect(cnt))
-
-        # Draw an isolated footprint of the shape
-        offset = tuple(- np.array(bbox.position()))
-        isolated = np.zeros(bbox.size(True), np.uint8)
-        cv2.drawContours(isolated, [cnt], 0, 255, -1, offset=offset)
-        footprint = cv2.copyMakeBorder(isolated, 15, 15, 15, 15, cv2.BORDER_CONSTANT, 0)
-
-        # Determine the color of the shape
-        x, y, w, h = bbox.xywh()
-        patch = realsensecam().bgr[y:y + h, x:x + w, :][int(h / 3):int(2 * h / 3), int(w / 3):int(2 * w / 3), :]
-        patch = cv2.GaussianBlur(patch, (51, 51), 0)
-        if patch is None:
-            color = (0, 0, 0)
-        else:
-            ph, pw, _ = patch.shape
-            color = patch[int(ph / 2), int(pw / 2)]
-            color = tuple([int(x) for x in color])
-            color_hsv = cv2.cvtColor(np.array([[color]], np.uint8), cv2.COLOR_BGR2HSV)[0][0]
-
-        self.cnt = cnt
-        self.bbox = bbox
-        self.color = color
-        self.color_hsv = color_hsv
-        self.footprint = footprint
+        self.cnt = detected_shape.cnt
+        self.bbox = detected_shape.bbox
+        self.color = detected_shape.color
+        self.color_hsv = detected_shape.color_hsv
+        self.descriptor = detected_shape.descriptor  # Used to recognize the shape once it has been lost
+        self.__footprint = None
         self.angle = 0
         self.state = 'fresh'
         self.state_stable_since = shapetracker().epoch
@@ -58,11 +39,21 @@ class Shape(Publisher):
         self.keypoints_on_down = None
         self.action_name = ""
 
+    # The color is kept from the creation of the shape, only the geometry is updated
     def update_from(self, other):
         self.cnt = other.cnt
         self.bbox = other.bbox
-        self.color = other.color
-        self.angle = other.angle
+        shapetracker().on_shape_bbox_changed(self)
+
+    # An isolated drawing of the shape (as first requested), only needed to visualize lost shapes
+    @property
+    def footprint(self):
+        if self.__footprint is None:
+            x, y, w, h = self.bbox.xywh()
+            isolated = np.zeros((h, w), np.uint8)
+            cv2.drawContours(isolated, [self.cnt], 0, 255, -1, offset=(-x, -y))
+            self.__footprint = cv2.copyMakeBorder(isolated, 15, 15, 15, 15, cv2.BORDER_CONSTANT, 0)
+        return self.__footprint
 
     def set_state(self, new_state):
         self.state = new_state
@@ -74,19 +65,21 @@ class Shape(Publisher):
 
     # Recommended threshold for detecting another shape: 1%
     def hue_difference(self, other_shape):
-        hs = self.color_hsv[0] * 2  # Due to 8 bit resolution in OpenCV, H is between 0 and 180 -> multiply by 2
-        ho = other_shape.color_hsv[0] * 2
+        hs = int(self.color_hsv[0]) * 2  # Due to 8 bit resolution in OpenCV, H is between 0 and 180 -> multiply by 2
+        ho = int(other_shape.color_hsv[0]) * 2
         return (180 - abs(abs(hs - ho) - 180)) / 360
 
     # Recommended threshold for detecting another shape: 10%
+    # Same as min(1, cv2.matchShapes(self.cnt, other_shape.cnt, cv2.CONTOURS_MATCH_I1, 0)) on the cached descriptors
     def shape_difference(self, other_shape):
-        return min(1, cv2.matchShapes(self.cnt, other_shape.cnt, 1, 0))
+        return shape_differences(self.descriptor.hu[None], other_shape.descriptor.hu[None])[0, 0]
 
     def on_finger_down(self, data, do_not_check_xy=False, initiated_by_shape=False):
         xy = np.array(data['fingertip_pos'])
         degs = data['finger_deg_delta']
         if do_not_check_xy or self.bbox.contains(*xy):
             self.pressed = True
+            shapetracker().pressed_shapes.add(self)
             self.initial_swipe_xy = xy
             self.current_swipe_xy = xy
             self.initial_move_xy = xy
@@ -107,6 +100,7 @@ class Shape(Publisher):
         xy = np.array(data['fingertip_pos'])
         if self.pressed:
             self.pressed = False
+            shapetracker().pressed_shapes.discard(self)
             self.needs_transform_to_fit_shape = True
             self.publish('finger_up', {
                 **data,
@@ -209,7 +203,7 @@ class Shape(Publisher):
             for touchet in self.keypoints.keys():
                 self.keypoints[touchet] = self.keypoints_on_down[touchet] + np.flip(translation)
         else:
-            self.cnt += np.flip(translation)
+            self.cnt = self.cnt + np.flip(translation)  # The contour may be shared with the shape detector
             for touchet in self.keypoints.keys():
                 self.keypoints[touchet] += np.flip(translation)
 
@@ -223,6 +217,7 @@ class Shape(Publisher):
 
         # Adjust bbox and save most recent angle
         self.bbox = Bbox(*cv2.boundingRect(self.cnt))
+        shapetracker().on_shape_bbox_changed(self)
         self.current_degs = -angle
         return translation, angle
 
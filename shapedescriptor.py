@@ -0,0 +1,121 @@
+import os
+import json
+import cv2
+import numpy as np
+
+
+# Compact, rotation invariant description of a shape used to recognize it: the Hu moments of its contour, its hue
+# (0-360), its area and the aspect ratio (<= 1) of its minimum area rectangle
+class ShapeDescriptor:
+    def __init__(self, hu, hue, area, aspect):
+        self.hu = np.asarray(hu, np.float64)
+        self.hue = hue
+        self.area = area
+        self.aspect = aspect
+
+    @staticmethod
+    def from_contour(cnt, moments, color_hsv):
+        (_, _), (w, h), _ = cv2.minAreaRect(cnt)
+        return ShapeDescriptor(cv2.HuMoments(moments).flatten(), int(color_hsv[0]) * 2, moments['m00'],
+                               min(w, h) / max(w, h, 1))
+
+    def to_array(self):
+        return np.concatenate((self.hu, [self.hue, self.area, self.aspect]))
+
+    @staticmethod
+    def from_array(arr):
+        return ShapeDescriptor(arr[:7], arr[7], arr[8], arr[9])
+
+
+# Pairwise hue differences (see Shape.hue_difference) between two arrays of hues (0-360)
+def hue_differences(hues, other_hues):
+    return (180 - np.abs(np.abs(hues[:, None] - other_hues[None, :]) - 180)) / 360
+
+
+# Terms of the I1 metric of cv2.matchShapes for an (n, 7) array of Hu moments: 1 / (sign(h) * log10(|h|)), and whether
+# each moment is used (|h| > 1e-5) and whether any moment is nonzero
+def __i1_terms(hu):
+    magnitude = np.abs(hu)
+    used = magnitude > 1e-5
+    with np.errstate(divide='ignore'):
+        terms = np.where(used, 1 / (np.sign(hu) * np.log10(np.where(used, magnitude, 2))), 0)
+    return terms, used, (magnitude > 0).any(axis=1)
+
+
+# Pairwise cv2.matchShapes(a, b, cv2.CONTOURS_MATCH_I1, 0) of two (n, 7) and (m, 7) arrays of Hu moments, capped at 1
+# (see Shape.shape_difference)
+def shape_differences(hu, other_hu):
+    terms, used, nonzero = __i1_terms(hu)
+    other_terms, other_used, other_nonzero = __i1_terms(other_hu)
+    both_used = used[:, None, :] & other_used[None, :, :]
+    differences = np.sum(np.abs(terms[:, None, :] - other_terms[None, :, :]) * both_used, axis=2)
+    differences[nonzero[:, None] != other_nonzero[None, :]] = 1  # cv2.matchShapes returns DBL_MAX
+    return np.minimum(differences, 1)
+
+
+# Descriptors of a set of shapes (e.g. the lost ones), stacked into arrays so that new shapes can be compared to all of
+# them at once. Entries are kept in the order they were added.
+# A DescriptorIndex can be saved to and loaded from an npz file, e.g. to keep a library of known shapes across sessions.
+class DescriptorIndex:
+    def __init__(self):
+        self.keys = []
+        self.descriptors = []
+        self.__arrays = None  # Stacked descriptors, rebuilt lazily after changes
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key, descriptor):
+        if key in self.keys:
+            self.remove(key)
+        self.keys.append(key)
+        self.descriptors.append(descriptor)
+        self.__arrays = None
+
+    def remove(self, key):
+        i = self.keys.index(key)
+        del self.keys[i]
+        del self.descriptors[i]
+        self.__arrays = None
+
+    def clear(self):
+        self.keys = []
+        self.descriptors = []
+        self.__arrays = None
+
+    def __stacked(self):
+        if self.__arrays is None:
+            self.__arrays = np.array([d.to_array() for d in self.descriptors]).reshape(-1, 10)
+        return self.__arrays
+
+    # Compares the descriptors of the index (rows) to the given descriptors (columns).
+    # Returns the matrices of the hue differences, the shape differences, the absolute log area ratios and the aspect
+    # ratio differences.
+    def differences(self, descriptors):
+        stacked = self.__stacked()
+        other = np.array([d.to_array() for d in descriptors]).reshape(-1, 10)
+        return (hue_differences(stacked[:, 7], other[:, 7]),
+                shape_differences(stacked[:, :7], other[:, :7]),
+                np.abs(np.log(np.maximum(stacked[:, 8, None], 1) / np.maximum(other[None, :, 8], 1))),
+                np.abs(stacked[:, 9, None] - other[None, :, 9]))
+
+    def save(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'wb') as outfile:  # np.savez would append .npz to the file name
+            np.savez(outfile, keys=json.dumps(self.keys), descriptors=self.__stacked())
+
+    @staticmethod
+    def load(filename):
+        index = DescriptorIndex()
+        try:
+            with np.load(filename) as stored:
+                for key, arr in zip(json.loads(str(stored['keys'])), stored['descriptors']):
+                    index.add(key, ShapeDescriptor.from_array(arr))
+        except (OSError, KeyError, ValueError):
+            pass
+        return index
@@ -5,7 +5,9 @@ from conf import conf
 from publisher import Publisher
 from realsensecam import realsensecam
 from handdetector import handdetector
+from motiondetector import motiondetector
 from shape import Shape
+from shapedescriptor import ShapeDescriptor
 from bbox import Bbox
 
 
@@ -19,23 +21,184 @@ def shapedetector(*init_params):
     return __shapedetector_instance
 
 
+# Shapes are segmented by color saturation. In incremental mode (shape_detection_incremental), the saturation mask and
+# the contours of the previous frames are kept and only the regions that changed are segmented again: the motion
+# detector compares the frame to the downsampled reference of the last segmentation in tiles of shape_detection_tile
+# px. Changed tiles are extended by the contours crossing them, the mask is recomputed and the contours are searched
+# within these regions only, while contours in the other regions are reused as they are. The full frame is segmented
+# every shape_detection_refresh_frames frames, and whenever the regions do not settle within MAX_GROWTH_PASSES passes
+# or cover most of the frame (e.g. on a noisy frame).
 class ShapeDetector(Publisher):
+    MAX_GROWTH_PASSES = 10
+
+    def __init__(self):
+        super().__init__()
+        self.most_recent_mask = None
+        self.frames_since_full_frame = 0
+        self.dirty_rects = []  # Regions (x, y, x2, y2) segmented in the current frame
+        self.__reference = None  # Downsampled frame the tiles were last segmented in
+        self.__contours = []  # (contour, bbox (x, y, x2, y2), DetectedShape or None if it is too small) of the mask
+
     def detect_shapes(self):
-        # Get mask by filtering by color saturation in HSV color space
-        hsv = cv2.cvtColor(realsensecam().bgr, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, np.array([0, conf()['shape_saturation_threshold'], 0]), np.array([255, 255, 255]))
-        self.most_recent_mask = mask
-
-        # Find contours in mask in order to isolate individual shapes
-        contours, _ = cv2.findContours(
-            mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        bgr = realsensecam().bgr
+        if not conf()['shape_detection_incremental'] or self.most_recent_mask is None or \
+                self.frames_since_full_frame >= conf()['shape_detection_refresh_frames']:
+            self.__segment_full_frame(bgr)
+        else:
+            self.__segment_changes(bgr)
+
         detected_shapes = []
-        for cnt in contours:
-            if cv2.contourArea(cnt) < 750:
+        for cnt, _, detected_shape in self.__contours:
+            if detected_shape is None:
                 continue
             if handdetector().cnt_intersects_with_hand(cnt):
                 continue
-            s = Shape(cnt)
-            if s is not None:
-                detected_shapes.append(s)
+            detected_shapes.append(detected_shape)
         return detected_shapes
+
+    # Get mask by filtering by color saturation in HSV color space
+    @staticmethod
+    def __saturation_mask(bgr):
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        return cv2.inRange(hsv, np.array([0, conf()['shape_saturation_threshold'], 0]), np.array([255, 255, 255]))
+
+    # Find contours in mask in order to isolate individual shapes
+    @staticmethod
+    def __find_contours(mask, bgr, offset=(0, 0)):
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+        found = []
+        for cnt in contours:
+            x, y, w, h = cv2.boundingRect(cnt)
+            moments = cv2.moments(cnt)
+            detected_shape = None
+            if moments['m00'] >= realsensecam().scale_area(750):
+                detected_shape = DetectedShape(cnt, moments, bgr)
+            found.append((cnt, (x, y, x + w, y + h), detected_shape))
+        return found
+
+    def __segment_full_frame(self, bgr):
+        self.most_recent_mask = self.__saturation_mask(bgr)
+        self.__contours = self.__find_contours(self.most_recent_mask, bgr)
+        self.__reference = motiondetector().small.copy()
+        self.frames_since_full_frame = 0
+        self.dirty_rects = [(0, 0, realsensecam().W, realsensecam().H)]
+
+    def __segment_changes(self, bgr):
+        self.frames_since_full_frame += 1
+        dirty_rects = self.__dirty_rects()
+        if dirty_rects is None:
+            self.__segment_full_frame(bgr)
+            return
+        self.dirty_rects = dirty_rects
+        if len(self.dirty_rects) == 0:
+            return
+
+        # Recompute the mask and the contours within the dirty regions, keep the other contours
+        kept = [c for c in self.__contours if not any(self.__overlaps(c[1], rect) for rect in self.dirty_rects)]
+        for rect in self.dirty_rects:
+            x, y, x2, y2 = rect
+            self.most_recent_mask[y:y2, x:x2] = self.__saturation_mask(bgr[y:y2, x:x2])
+            kept += self.__find_contours(self.most_recent_mask[y:y2, x:x2], bgr, (x, y))
+            small_rows, small_cols = motiondetector().slices(rect)
+            self.__reference[small_rows, small_cols] = motiondetector().small[small_rows, small_cols]
+        self.__contours = kept
+
+    # Regions (x, y, x2, y2) to segment again: the changed tiles (grown by one tile), merged with each other and
+    # extended by the contours they overlap until no contour crosses the border of a region. Only contours large enough
+    # to be shapes are considered, smaller ones may be cut (they are found completely again by the next full frame).
+    # Returns None if the full frame should be segmented instead.
+    def __dirty_rects(self):
+        tile = max(1, int(realsensecam().scale_px(conf()['shape_detection_tile'])))
+        tiles = motiondetector().changed_tiles(self.__reference, tile)
+        if not tiles.any():
+            return []
+        tiles = cv2.dilate(tiles.astype(np.uint8), np.ones((3, 3), np.uint8))
+        n, _, stats, _ = cv2.connectedComponentsWithStats(tiles, connectivity=8)
+        rects = [(x * tile, y * tile, min(realsensecam().W, (x + w) * tile), min(realsensecam().H, (y + h) * tile))
+                 for x, y, w, h, _ in stats[1:n]]
+
+        shape_bboxes = [c[1] for c in self.__contours if c[2] is not None]
+        grown = True
+        passes = 0
+        while grown:
+            if passes == self.MAX_GROWTH_PASSES:
+                return None
+            passes += 1
+            grown = False
+            for bbox in shape_bboxes:
+                for i, rect in enumerate(rects):
+                    if self.__overlaps(bbox, rect) and not self.__contains(rect, bbox):
+                        rects[i] = self.__union(rect, bbox)
+                        grown = True
+            # Merge overlapping regions, so that no contour is found twice
+            merged = []
+            for rect in rects:
+                for i, other in enumerate(merged):
+                    if self.__overlaps(rect, other):
+                        merged[i] = self.__union(rect, other)
+                        grown = True
+                        break
+                else:
+                    merged.append(rect)
+            rects = merged
+        if sum((x2 - x) * (y2 - y) for x, y, x2, y2 in rects) > realsensecam().W * realsensecam().H / 2:
+            return None
+        return rects
+
+    # Whether the box (x, y, x2, y2) of a contour (x2, y2 exclusive) and a region overlap or touch, i.e. whether the
+    # contour may be connected to pixels of the region
+    @staticmethod
+    def __overlaps(bbox, rect):
+        return bbox[0] <= rect[2] and rect[0] <= bbox[2] and bbox[1] <= rect[3] and rect[1] <= bbox[3]
+
+    @staticmethod
+    def __contains(rect, bbox):
+        return rect[0] <= bbox[0] and rect[1] <= bbox[1] and bbox[2] <= rect[2] and bbox[3] <= rect[3]
+
+    @staticmethod
+    def __union(rect, other):
+        return min(rect[0], other[0]), min(rect[1], other[1]), max(rect[2], other[2]), max(rect[3], other[3])
+
+
+# A shape detected in the current frame. Most detections only confirm the position of a shape that is already tracked,
+# so only the geometry is determined right away. The color is computed on first access (e.g. when the detection is
+# compared to a lost shape) and a Shape is only created for detections that turn out to be new.
+class DetectedShape:
+    def __init__(self, cnt, moments, bgr):
+        self.cnt = cnt
+        self.bbox = Bbox(*cv2.boundingRect(cnt))
+        self.moments = moments
+        self.area = moments['m00']
+        x, y, w, h = self.bbox.xywh()
+        self.__bgr = bgr[y:y + h, x:x + w].copy()  # Bbox of the frame the shape was detected in, the frame is not kept
+        self.__color = None
+        self.__color_hsv = None
+        self.__descriptor = None
+
+    # Mean color of the shape, leaving out its border where it blends with the table
+    @property
+    def color(self):
+        if self.__color is None:
+            x, y, w, h = self.bbox.xywh()
+            mask = np.zeros((h, w), np.uint8)
+            cv2.drawContours(mask, [self.cnt], 0, 255, -1, offset=(-x, -y))
+            cv2.drawContours(mask, [self.cnt], 0, 0, 3, offset=(-x, -y))
+            if not mask.any():  # Too thin, use all of it
+                cv2.drawContours(mask, [self.cnt], 0, 255, -1, offset=(-x, -y))
+            self.__color = tuple(int(round(c)) for c in cv2.mean(self.__bgr, mask=mask)[:3])
+        return self.__color
+
+    @property
+    def color_hsv(self):
+        if self.__color_hsv is None:
+            self.__color_hsv = cv2.cvtColor(np.array([[self.color]], np.uint8), cv2.COLOR_BGR2HSV)[0][0]
+        return self.__color_hsv
+
+    @property
+    def descriptor(self):
+        if self.__descriptor is None:
+            self.__descriptor = ShapeDescriptor.from_contour(self.cnt, self.moments, self.color_hsv)
+        return self.__descriptor
+
+    def create_shape(self):
+        return Shape(self)
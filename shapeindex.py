@@ -0,0 +1,82 @@
+# Uniform grid over the frame that finds the shapes whose (padded) bbox contains a point without looking at every
+# shape. Every shape is registered in all cells its padded bbox overlaps, so a query only checks the shapes of a single
+# cell. Shapes are returned in the order they were inserted, which is the order of ShapeTracker.shapes.
+class ShapeIndex:
+    def __init__(self, cell_size, padding=0):
+        self.cell_size = max(1, int(cell_size))
+        self.padding = padding
+        self.cells = {}  # (col, row) -> set of shapes
+        self.entries = {}  # shape -> (insertion order, padded bbox (x, y, x2, y2), cell range (col, row, col2, row2))
+        self.order = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, shape):
+        return shape in self.entries
+
+    def __padded_bbox(self, shape):
+        bbox = shape.bbox
+        return bbox.x - self.padding, bbox.y - self.padding, bbox.x2 + self.padding, bbox.y2 + self.padding
+
+    def __cell_range(self, padded_bbox):
+        x, y, x2, y2 = padded_bbox
+        return int(x // self.cell_size), int(y // self.cell_size), int(x2 // self.cell_size), int(y2 // self.cell_size)
+
+    def __add_to_cells(self, shape, cell_range):
+        col, row, col2, row2 = cell_range
+        for c in range(col, col2 + 1):
+            for r in range(row, row2 + 1):
+                self.cells.setdefault((c, r), set()).add(shape)
+
+    def __remove_from_cells(self, shape, cell_range):
+        col, row, col2, row2 = cell_range
+        for c in range(col, col2 + 1):
+            for r in range(row, row2 + 1):
+                cell = self.cells[(c, r)]
+                cell.discard(shape)
+                if len(cell) == 0:
+                    del self.cells[(c, r)]
+
+    def insert(self, shape):
+        if shape in self.entries:
+            return
+        self.order += 1
+        padded_bbox = self.__padded_bbox(shape)
+        cell_range = self.__cell_range(padded_bbox)
+        self.entries[shape] = (self.order, padded_bbox, cell_range)
+        self.__add_to_cells(shape, cell_range)
+
+    def remove(self, shape):
+        if shape not in self.entries:
+            return
+        _, _, cell_range = self.entries.pop(shape)
+        self.__remove_from_cells(shape, cell_range)
+
+    # Call whenever the bbox of an indexed shape has changed, shapes that are not indexed are ignored
+    def update(self, shape):
+        if shape not in self.entries:
+            return
+        order, _, old_cell_range = self.entries[shape]
+        padded_bbox = self.__padded_bbox(shape)
+        cell_range = self.__cell_range(padded_bbox)
+        self.entries[shape] = (order, padded_bbox, cell_range)
+        if cell_range != old_cell_range:
+            self.__remove_from_cells(shape, old_cell_range)
+            self.__add_to_cells(shape, cell_range)
+
+    # Returns the set of shapes whose padded bbox contains (x, y)
+    def query(self, x, y):
+        cell = self.cells.get((int(x // self.cell_size), int(y // self.cell_size)))
+        if cell is None:
+            return set()
+        hits = set()
+        for shape in cell:
+            bx, by, bx2, by2 = self.entries[shape][1]
+            if bx <= x <= bx2 and by <= y <= by2:
+                hits.add(shape)
+        return hits
+
+    # Returns the given shapes that are indexed, in insertion order
+    def in_order(self, shapes):
+        return sorted((s for s in shapes if s in self.entries), key=lambda s: self.entries[s][0])
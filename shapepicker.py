@@ -37,7 +37,7 @@ class ShapePicker:
 
         xy = data['fingertip_pos']
         found = False
-        for id, shape in shapetracker().shapes.items():
+        for shape in shapetracker().shape_index.in_order(shapetracker().shape_index.query(*xy)):
             if shape.bbox.contains(*xy):
                 if shape != self.shape:
                     self.shape = shape
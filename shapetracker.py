@@ -3,7 +3,10 @@ import numpy as np
 
 from conf import conf
 from publisher import Publisher
+from shapeindex import ShapeIndex
+from shapedescriptor import DescriptorIndex, hue_differences
 from handdetector import handdetector
+from realsensecam import realsensecam
 from touchetmanager import touchetmanager
 
 __shapetracker_instance = None
@@ -21,9 +24,17 @@ class ShapeTracker(Publisher):
         super().__init__()
         self.shapes = {}
         self.lost_shapes = {}
+        self.lost_index = DescriptorIndex()  # Descriptors of the lost shapes, by id
         self.pending_shapes = []  # Only used for visualization
         self.highest_id = 0
         self.epoch = 0
+        # Spatial index of the bboxes of the tracked shapes, so that finger events only go to the shapes under the finger
+        self.shape_index = ShapeIndex(realsensecam().scale_px(conf()['shape_index_cell_size']),
+                                      realsensecam().scale_px(conf()['shape_index_padding']))
+        self.pressed_shapes = set()
+        # Descriptors of the shapes that have been assigned an action, by action. Fresh shapes that match one of them
+        # get its action again, also in later sessions.
+        self.shape_library = DescriptorIndex.load(conf()['shape_library_file']) if conf()['shape_library_file'] else None
 
     def process_detected_shapes(self, detected_shapes):
         self.epoch += 1
@@ -31,22 +42,23 @@ class ShapeTracker(Publisher):
         new_shape_ids = set()
         self.pending_shapes = []
 
-        # Attempt to match shapes by distance
-        for old_id, old_shape in self.shapes.items():
-            for detected_shape in detected_shapes:
-                if np.linalg.norm(old_shape.bbox.center_nparr() - detected_shape.bbox.center_nparr()) < 30:
-                    self.__update_shape_from(old_shape, detected_shape)
-                    if old_shape.state == 'covered':
-                        old_shape.set_state('visible')
-                    new_shape_ids.add(old_id)
-                    detected_shapes.remove(detected_shape)
-                    break
+        # Match the tracked shapes to the detected shapes by distance (optionally also by hue and area)
+        old_ids = list(self.shapes.keys())
+        matches = self.__assign(self.__tracking_costs([self.shapes[id] for id in old_ids], detected_shapes))
+        for i, j in matches:
+            old_shape = self.shapes[old_ids[i]]
+            self.__update_shape_from(old_shape, detected_shapes[j])
+            if old_shape.state == 'covered':
+                old_shape.set_state('visible')
+            new_shape_ids.add(old_ids[i])
+        matched = set(j for _, j in matches)
+        detected_shapes = [d for j, d in enumerate(detected_shapes) if j not in matched]
 
         # Remove shapes that were not seen
         for missing_id in old_shape_ids - new_shape_ids:
             state = self.shapes[missing_id].state
             if state == 'fresh':
-                del self.shapes[missing_id]
+                self.__remove_shape(missing_id)
             if state == 'visible':
                 if handdetector().cnt_intersects_with_hand(self.shapes[missing_id].cnt):
                     self.shapes[missing_id].set_state('covered')
@@ -54,39 +66,131 @@ class ShapeTracker(Publisher):
                 if not handdetector().cnt_intersects_with_hand(self.shapes[missing_id].cnt):
                     self.shapes[missing_id].set_state('lost')
                     self.lost_shapes[missing_id] = self.shapes[missing_id]
-                    del self.shapes[missing_id]
+                    self.lost_index.add(missing_id, self.shapes[missing_id].descriptor)
+                    self.__remove_shape(missing_id)
 
         # Remaining shapes are new. Check if there is a match in the lost shapes, otherwise insert fresh shape.
-        perfect_match = False
+        lost_ids = list(self.lost_index.keys)
         # Special case "Perfect Match": We're looking for a single shape and found a single shape.
         # They are very likely the same, no check needed.
         if len(detected_shapes) == 1 and len(self.lost_shapes) == 1:
-            perfect_match = True
-        for detected_shape in detected_shapes:
-            restored = False
-            for id, lost_shape in self.lost_shapes.items():
-                if perfect_match or detected_shape.hue_difference(lost_shape) < 0.15 and detected_shape.shape_difference(lost_shape) < 0.6:
-                    lost_shape.state = 'visible'
-                    self.__update_shape_from(lost_shape, detected_shape)
-                    self.shapes[id] = lost_shape
-                    del self.lost_shapes[id]
-                    new_shape_ids.add(id)
-                    restored = True
-                    break
-            if not restored:
+            restorations = [(0, 0)]
+        else:
+            restorations = self.__assign(self.__restoration_costs(detected_shapes))
+        restored = {j: lost_ids[i] for i, j in restorations}
+        fresh_shapes = []
+        for j, detected_shape in enumerate(detected_shapes):
+            if j in restored:
+                id = restored[j]
+                lost_shape = self.lost_shapes.pop(id)
+                self.lost_index.remove(id)
+                lost_shape.state = 'visible'
+                self.__update_shape_from(lost_shape, detected_shape)
+                self.__add_shape(id, lost_shape)
+                new_shape_ids.add(id)
+            else:
                 # There is no memory of the shape we're seeing -> insert fresh shape
                 if handdetector().hand_cnt is None:
                     self.highest_id += 1
-                    self.shapes[self.highest_id] = detected_shape
+                    self.__add_shape(self.highest_id, detected_shape.create_shape())
+                    fresh_shapes.append(self.shapes[self.highest_id])
                 else:
                     self.pending_shapes.append(detected_shape)
 
+        self.__recognize(fresh_shapes)
+
         # State changes
         for id, shape in self.shapes.items():
             if shape.state == 'fresh':
                 if self.percentage_for_shape(shape) > .99:
                     shape.set_state('visible')
 
+    # Cost of continuing each tracked shape (rows) with each detected shape (columns). Pairs whose centers are further
+    # apart than shape_match_distance are not allowed (inf). Within the gate, the distance is normalized by the gate and
+    # the hue and area differences are added with their weights.
+    def __tracking_costs(self, shapes, detected_shapes):
+        if len(shapes) == 0 or len(detected_shapes) == 0:
+            return np.zeros((len(shapes), len(detected_shapes)))
+        gate = realsensecam().scale_px(conf()['shape_match_distance'])
+        centers = np.array([s.bbox.center() for s in shapes], np.float64)
+        detected_centers = np.array([d.bbox.center() for d in detected_shapes], np.float64)
+        distances = np.linalg.norm(centers[:, None, :] - detected_centers[None, :, :], axis=2)
+        costs = distances / gate
+        if conf()['shape_match_hue_weight'] > 0:
+            costs += conf()['shape_match_hue_weight'] * self.__hue_differences(shapes, detected_shapes)
+        if conf()['shape_match_area_weight'] > 0:
+            areas = np.array([cv2.contourArea(s.cnt) for s in shapes])
+            detected_areas = np.array([cv2.contourArea(d.cnt) for d in detected_shapes])
+            costs += conf()['shape_match_area_weight'] * np.abs(np.log(np.maximum(areas[:, None], 1) / np.maximum(detected_areas[None, :], 1)))
+        costs[distances >= gate] = np.inf
+        return costs
+
+    # Cost of restoring each lost shape (rows, in the order of lost_index) from each detected shape (columns), regardless
+    # of their positions. Pairs that differ by 15% or more in hue or by 0.6 or more in shape are not allowed (inf).
+    def __restoration_costs(self, detected_shapes):
+        if len(self.lost_index) == 0 or len(detected_shapes) == 0:
+            return np.zeros((len(self.lost_index), len(detected_shapes)))
+        hue_diffs, shape_diffs, _, _ = self.lost_index.differences([d.descriptor for d in detected_shapes])
+        return np.where((hue_diffs < 0.15) & (shape_diffs < 0.6), hue_diffs / 0.15 + shape_diffs / 0.6, np.inf)
+
+    # Pairwise version of Shape.hue_difference
+    @staticmethod
+    def __hue_differences(shapes, other_shapes):
+        return hue_differences(np.array([int(s.color_hsv[0]) * 2 for s in shapes]),
+                               np.array([int(o.color_hsv[0]) * 2 for o in other_shapes]))
+
+    # Solves the assignment problem for the given cost matrix (inf: pair not allowed), i.e. finds the pairs with the
+    # lowest total cost such that every row and every column is used at most once.
+    # Returns the list of (row, column) pairs, sorted by row.
+    @staticmethod
+    def __assign(costs):
+        allowed = np.isfinite(costs)
+        if not allowed.any():
+            return []
+        from scipy.optimize import linear_sum_assignment
+        # Forbidden pairs get a cost higher than any combination of allowed ones, so that as many shapes as possible
+        # are matched; they are dropped afterwards
+        bounded = np.where(allowed, costs, np.sum(costs[allowed]) + 1)
+        rows, cols = linear_sum_assignment(bounded)
+        return [(i, j) for i, j in zip(rows, cols) if allowed[i, j]]
+
+    # Add the shape to the library of known shapes under its action (if it has one)
+    def remember_shape(self, shape):
+        if self.shape_library is None or not shape.action_name:
+            return
+        self.shape_library.add(shape.action_name, shape.descriptor)
+        self.shape_library.save(conf()['shape_library_file'])
+
+    # Give fresh shapes the actions of the best matching shapes of the library, each action at most once on the table.
+    # Besides hue and shape, the area (the camera does not move) and the aspect ratio have to match.
+    def __recognize(self, fresh_shapes):
+        if self.shape_library is None or len(self.shape_library) == 0 or len(fresh_shapes) == 0:
+            return
+        hue_diffs, shape_diffs, area_diffs, aspect_diffs = self.shape_library.differences([s.descriptor for s in fresh_shapes])
+        allowed = (hue_diffs < 0.15) & (shape_diffs < 0.6) & (area_diffs < 0.25) & (aspect_diffs < 0.15)
+        taken = set(s.action_name for s in self.shapes.values())
+        allowed[[key in taken for key in self.shape_library.keys], :] = False
+        costs = np.where(allowed, hue_diffs / 0.15 + shape_diffs / 0.6 + area_diffs / 0.25 + aspect_diffs / 0.15, np.inf)
+        for i, j in self.__assign(costs):
+            fresh_shapes[j].action_name = self.shape_library.keys[i]
+
+    # Shapes that may react to a finger at xy: those whose bbox contains it and those that are currently pressed.
+    # They are returned in the order of self.shapes.
+    def shapes_at(self, xy):
+        return self.shape_index.in_order(self.shape_index.query(*xy) | self.pressed_shapes)
+
+    # Call whenever the bbox of a shape has changed
+    def on_shape_bbox_changed(self, shape):
+        self.shape_index.update(shape)
+
+    def __add_shape(self, id, shape):
+        self.shapes[id] = shape
+        self.shape_index.insert(shape)
+
+    def __remove_shape(self, id):
+        self.shape_index.remove(self.shapes[id])
+        del self.shapes[id]
+
     def percentage_for_shape(self, shape):
         if shape.state == 'fresh':
             val = min(self.epoch - shape.state_stable_since, conf()['shape_confirm_frames'])
@@ -97,7 +201,9 @@ class ShapeTracker(Publisher):
     # This method should be subscribed to the hand disappearing
     def clear_lost_shapes(self, *_):
         touchetmanager().clear_touchets_with_shapes(self.lost_shapes.values())
+        self.pressed_shapes.difference_update(self.lost_shapes.values())
         self.lost_shapes.clear()
+        self.lost_index.clear()
 
     def __update_shape_from(self, shape_to_update, detected_shape):
         if shape_to_update.needs_transform_to_fit_shape:
@@ -0,0 +1,42 @@
+import time
+import numpy as np
+
+
+# Accumulates wall clock durations of named pipeline stages, e.g.
+#     with timer.measure('hand_detection'):
+#         handdetector().determine_hand_cnt()
+class StageTimer:
+    def __init__(self):
+        self.durations = {}
+
+    def measure(self, stage):
+        return _Measurement(self, stage)
+
+    def add(self, stage, duration):
+        if stage in self.durations:
+            self.durations[stage].append(duration)
+        else:
+            self.durations[stage] = [duration]
+
+    def clear(self):
+        self.durations = {}
+
+    def report(self, frames):
+        lines = ["{:<24} {:>8} {:>10} {:>10} {:>10}".format("Stage", "Calls", "Mean ms", "p95 ms", "ms/frame")]
+        for stage, durations in self.durations.items():
+            d = np.array(durations) * 1000
+            lines.append("{:<24} {:>8d} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                stage, len(d), np.mean(d), np.percentile(d, 95), np.sum(d) / max(1, frames)))
+        return "\n".join(lines)
+
+
+class _Measurement:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, type, value, traceback):
+        self.timer.add(self.stage, time.perf_counter() - self.start)
@@ -0,0 +1,211 @@
+import cv2
+import numpy as np
+
+
+# Renders a table scene with colored paper shapes and an arm entering from the bottom edge, as seen by the camera:
+# a bgr frame and the raw (aligned) depth in mm. The fingertip follows a script made of keyframes, which allows to
+# replay touches, drags and rotations of shapes without any hardware.
+class SyntheticScene:
+    ARM_COLOR = (140, 165, 205)  # Skin, low saturation so that the arm is never detected as a shape
+    TABLE_COLOR = (200, 200, 200)
+    CONTACT_MM = 8  # Height of the top of the fingertip above the table when touching it
+    MIN_SHAPE_AREA = 750  # Smallest area of a detected shape at 640x480 (see ShapeDetector)
+
+    def __init__(self, w=640, h=480, num_shapes=5, script='all', repeat=1, fps=30, table_distance_mm=400,
+                 shape_radius=None, noise_mm=1, seed=0):
+        self.w = w
+        self.h = h
+        self.fps = fps
+        self.noise_mm = noise_mm
+        self.rng = np.random.default_rng(seed)
+        self.frame = 0
+
+        # The table is a slightly tilted plane
+        ys, xs = np.mgrid[0:h, 0:w]
+        self.depth_background = (table_distance_mm + 0.01 * xs + 0.02 * ys).astype(np.uint16)
+        self.max_dist_mm = int(np.max(self.depth_background)) + 100
+        self.table_bgr = np.full((h, w, 3), self.TABLE_COLOR, np.uint8)
+
+        self.shapes = self.__place_shapes(num_shapes, shape_radius)
+        self.grabbed = None
+
+        # Fingertip state: position, height above the table (mm) and rotation applied to the grabbed shape (degrees)
+        self.state = {'pos': np.array([w / 2, h + 200.0]), 'height': 60.0, 'angle': 0.0, 'grab': False}
+        self.keyframes = []
+        for i in range(repeat):
+            self.keyframes += self.__script(script)
+        self.keyframe = 0
+        self.keyframe_frame = 0
+        self.keyframe_start = None
+        self.keyframe_target = None
+        self.finger_in_contact = False
+        self.fingertip_pos = None
+
+    def __place_shapes(self, num_shapes, shape_radius):
+        # Distribute the shapes on a grid (leaving the menu squares in the top corners free), one shape per cell.
+        # Every shape is made large enough to be detected (with a margin), as long as it still fits into its cell.
+        scale = np.sqrt(self.w * self.h / (640 * 480))
+        min_area = 1.25 * self.MIN_SHAPE_AREA * scale ** 2
+        cols = int(np.ceil(np.sqrt(num_shapes * self.w / self.h)))
+        rows = int(np.ceil(num_shapes / cols))
+        cell = min(self.w / cols, (self.h - 60) / rows)
+        radius = shape_radius if shape_radius is not None else min(35 * scale, cell / 2.6)
+        cells = self.rng.permutation(cols * rows)[:num_shapes]
+        shapes = []
+        for c in cells:
+            center = np.array([(c % cols + .5) * self.w / cols, 60 + (c // cols + .5) * (self.h - 60) / rows])
+            hue = self.rng.integers(0, 180)
+            color = cv2.cvtColor(np.array([[[hue, 220, 200]]], np.uint8), cv2.COLOR_HSV2BGR)[0, 0]
+            sides = int(self.rng.integers(3, 7))
+            min_radius = np.sqrt(min_area / (sides / 2 * np.sin(2 * np.pi / sides)))  # Of a polygon of min_area
+            shapes.append({
+                'center': center,
+                'radius': min(max(radius * self.rng.uniform(.8, 1), min_radius), cell / 2.2),
+                'sides': sides,
+                'angle': self.rng.uniform(0, 360),
+                'color': tuple(int(x) for x in color),
+            })
+
+        detectable = self.__count_detectable_shapes(shapes, self.MIN_SHAPE_AREA * scale ** 2)
+        if detectable != num_shapes:
+            raise ValueError("Only {} of {} shapes fit into a {}x{} scene as separate, detectable shapes".format(
+                detectable, num_shapes, self.w, self.h))
+        return shapes
+
+    # Number of separate shapes of at least min_area, as the shape detector would see them on the empty table
+    def __count_detectable_shapes(self, shapes, min_area):
+        mask = np.zeros((self.h, self.w), np.uint8)
+        for shape in shapes:
+            cv2.fillPoly(mask, [self.shape_polygon(shape)], 255)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return sum(1 for cnt in contours if cv2.moments(cnt)['m00'] >= min_area)
+
+    # A script is a list of keyframes (duration in frames, fingertip position, height, rotation, grab). Positions may be
+    # given as functions, which are evaluated when the keyframe starts (e.g. to follow a shape that has been moved).
+    def __script(self, name):
+        if name == 'idle':
+            return [self.__keyframe(60, lambda: self.state['pos'], 60)]
+        if name == 'all':
+            return self.__script('touch') + self.__script('drag') + self.__script('rotate')
+        if len(self.shapes) == 0:
+            target = lambda: np.array([self.w / 2, self.h / 2])
+        else:
+            shape = self.shapes[self.rng.integers(0, len(self.shapes))]
+            target = lambda: shape['center'].copy()
+        keyframes = [self.__keyframe(20, target, 60)]  # Approach
+        if name == 'touch':
+            keyframes += [self.__keyframe(6, target, self.CONTACT_MM),
+                          self.__keyframe(15, target, self.CONTACT_MM)]
+        elif name == 'drag':
+            delta = self.rng.uniform(-80, 80, 2)
+            to = lambda: np.clip(self.state['pos'] + delta, 60, (self.w - 60, self.h - 60))
+            keyframes += [self.__keyframe(6, target, self.CONTACT_MM),
+                          self.__keyframe(10, target, self.CONTACT_MM, grab=True),
+                          self.__keyframe(40, to, self.CONTACT_MM, grab=True),
+                          self.__keyframe(10, lambda: self.state['pos'], self.CONTACT_MM)]
+        elif name == 'rotate':
+            keyframes += [self.__keyframe(6, target, self.CONTACT_MM),
+                          self.__keyframe(10, target, self.CONTACT_MM, grab=True),
+                          self.__keyframe(40, target, self.CONTACT_MM, angle=self.rng.uniform(-45, 45), grab=True),
+                          self.__keyframe(10, target, self.CONTACT_MM)]
+        else:
+            raise ValueError("Unknown script {}".format(name))
+        keyframes += [self.__keyframe(6, lambda: self.state['pos'], 60),  # Lift
+                      self.__keyframe(20, lambda: np.array([self.state['pos'][0], self.h + 200.0]), 60)]  # Leave
+        return keyframes
+
+    @staticmethod
+    def __keyframe(frames, pos, height, angle=0.0, grab=False):
+        return frames, {'pos': pos, 'height': height, 'angle': angle, 'grab': grab}
+
+    # Advance the script by one frame. Returns False once the script has ended.
+    def __advance(self):
+        if self.keyframe >= len(self.keyframes):
+            return False
+        frames, target = self.keyframes[self.keyframe]
+        if self.keyframe_frame == 0:
+            self.keyframe_start = dict(self.state)
+            self.keyframe_target = dict(target, pos=np.array(target['pos'](), np.float64))
+        target = self.keyframe_target
+        self.keyframe_frame += 1
+        t = self.keyframe_frame / frames
+        start = self.keyframe_start
+        self.state = {
+            'pos': start['pos'] + t * (target['pos'] - start['pos']),
+            'height': start['height'] + t * (target['height'] - start['height']),
+            'angle': start['angle'] + t * (target['angle'] - start['angle']) if target['grab'] else 0.0,
+            'grab': target['grab'],
+        }
+        if self.keyframe_frame >= frames:
+            self.keyframe += 1
+            self.keyframe_frame = 0
+        return True
+
+    def __update_grabbed_shape(self):
+        pos = self.state['pos']
+        self.finger_in_contact = self.state['height'] <= self.CONTACT_MM
+        if not self.state['grab'] or not self.finger_in_contact:
+            self.grabbed = None
+            return
+        if self.grabbed is None:
+            candidates = [s for s in self.shapes if np.linalg.norm(s['center'] - pos) < s['radius']]
+            if len(candidates) == 0:
+                return
+            shape = min(candidates, key=lambda s: np.linalg.norm(s['center'] - pos))
+            self.grabbed = (shape, shape['center'] - pos, shape['angle'])
+        shape, offset, angle = self.grabbed
+        shape['center'] = pos + offset
+        shape['angle'] = angle + self.state['angle']
+
+    @staticmethod
+    def shape_polygon(shape):
+        angles = np.deg2rad(shape['angle'] + np.arange(shape['sides']) * 360 / shape['sides'])
+        pts = shape['center'] + shape['radius'] * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+        return np.round(pts).astype(np.int32)
+
+    # Draws the arm into the bgr frame and returns its height above the table (mm) for every pixel
+    def __render_arm(self, bgr):
+        height = np.zeros((self.h, self.w), np.float32)
+        tip = self.state['pos']
+        if tip[1] - 20 > self.h:
+            return height  # Hand has left the frame
+        entry = np.array([tip[0] + 80, self.h + 40.0])
+        direction = (entry - tip) / np.linalg.norm(entry - tip)
+        tip_height = self.state['height']
+
+        # (length along the arm, width, height at start, height at end) of finger, palm and forearm
+        pieces = [(60, 16, tip_height, tip_height + 15),
+                  (80, 60, tip_height + 25, tip_height + 40),
+                  (np.linalg.norm(entry - tip) + 100, 70, tip_height + 40, tip_height + 80)]
+        offset = 0
+        for length, width, h0, h1 in pieces:
+            # Draw the piece from its low to its high end in short segments, so that the height ramps up
+            steps = max(1, int(length / 10))
+            for i in range(steps):
+                p0 = tip + direction * (offset + length * i / steps)
+                p1 = tip + direction * (offset + length * (i + 1) / steps)
+                p0 = tuple(int(v) for v in np.round(p0))
+                p1 = tuple(int(v) for v in np.round(p1))
+                cv2.line(height, p0, p1, float(h0 + (h1 - h0) * (i + .5) / steps), width)
+                cv2.line(bgr, p0, p1, self.ARM_COLOR, width)
+            offset += length
+        return height
+
+    # Returns (bgr, raw depth in mm as uint16, timestamp in seconds) or None once the script has ended
+    def render(self):
+        if not self.__advance():
+            return None
+        self.frame += 1
+        self.__update_grabbed_shape()
+        self.fingertip_pos = tuple(int(v) for v in self.state['pos'])
+
+        bgr = self.table_bgr.copy()
+        for shape in self.shapes:
+            cv2.fillPoly(bgr, [self.shape_polygon(shape)], shape['color'])
+        height = self.__render_arm(bgr)
+
+        depth = self.depth_background - height
+        if self.noise_mm > 0:
+            depth += self.rng.normal(0, self.noise_mm, depth.shape).astype(np.float32)
+        depth = np.clip(np.round(depth), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+        return bgr, depth, self.frame / self.fps
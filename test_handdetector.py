@@ -0,0 +1,25 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from handdetector import HandDetector
+
+furthest_pair_1_norm = HandDetector._HandDetector__furthest_pair_1_norm
+
+
+# The linear time search has to return the same pair as argmax over the full distance matrix, ties included
+def test_furthest_pair_1_norm_matches_cdist():
+    rng = np.random.default_rng(0)
+    for n in [2, 3, 10, 100]:
+        for _ in range(200):
+            # Few distinct coordinates, so that there are many ties
+            pts = rng.integers(0, 8, (n, 2))
+            dists = cdist(pts, pts, 'cityblock')
+            expected = np.unravel_index(np.argmax(dists), dists.shape)
+            assert furthest_pair_1_norm(pts) == expected
+
+
+def test_furthest_pair_1_norm_on_frame_edge():
+    # Edge points of a contour, as HandDetector passes them
+    pts = np.array([[0, 479], [120, 479], [300, 479], [639, 400]], np.int32)
+    i, j = furthest_pair_1_norm(pts)
+    assert {i, j} == {0, 3}
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import rawrecording
+from rawrecording import RawRecordingWriter, RawRecordingReader, encode_depth, decode_depth
+
+
+def random_depth(rng, shape=(48, 64)):
+    depth = (400 + rng.normal(0, 30, shape).cumsum(axis=1)).clip(0, 65535).astype(np.uint16)
+    # Holes and extreme values, so that the row-wise deltas wrap around
+    depth[rng.random(shape) < 0.05] = 0
+    depth[0, 1] = 65535
+    return depth
+
+
+@pytest.mark.parametrize('codec', ['delta-shuffle-zlib', 'delta-shuffle-zstd'])
+def test_depth_codec_round_trip(codec):
+    if codec == 'delta-shuffle-zstd' and rawrecording.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    depth = random_depth(np.random.default_rng(0))
+    decoded = decode_depth(encode_depth(depth, codec), codec, depth.shape)
+    assert decoded.dtype == np.uint16
+    np.testing.assert_array_equal(decoded, depth)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        encode_depth(np.zeros((2, 2), np.uint16), 'none')
+
+
+def test_recording_round_trip(tmp_path):
+    rng = np.random.default_rng(1)
+    filename = str(tmp_path / 'session.tcraw')
+    background = random_depth(rng)
+    frames = [(rng.integers(0, 256, (48, 64, 3), np.uint8), random_depth(rng), 0.1 * i) for i in range(3)]
+    writer = RawRecordingWriter(filename, (64, 48), background, 500, 'delta-shuffle-zlib')
+    for bgr, depth, timestamp in frames:
+        writer.process_frame(bgr, depth, timestamp)
+    writer.stop()
+
+    reader = RawRecordingReader(filename)
+    assert len(reader) == 3
+    assert reader.max_dist_mm == 500
+    np.testing.assert_array_equal(reader.depth_background, background)
+    for i, (bgr, depth, timestamp) in enumerate(frames):
+        seq, read_timestamp, read_bgr, read_depth = reader.read(i)
+        assert seq == i + 1
+        assert read_timestamp == timestamp
+        np.testing.assert_array_equal(read_bgr, bgr)
+        np.testing.assert_array_equal(read_depth, depth)
+    reader.close()
+
+
+def test_truncated_recording(tmp_path):
+    rng = np.random.default_rng(2)
+    filename = str(tmp_path / 'session.tcraw')
+    writer = RawRecordingWriter(filename, (64, 48), random_depth(rng), 500, 'delta-shuffle-zlib')
+    for i in range(2):
+        writer.process_frame(rng.integers(0, 256, (48, 64, 3), np.uint8), random_depth(rng), i)
+    writer.stop()
+    with open(filename, 'r+b') as f:  # Cut the last frame in half, as after a crash
+        f.truncate(f.seek(0, 2) - 5000)
+
+    reader = RawRecordingReader(filename)
+    assert len(reader) == 1
+    reader.close()
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+from shapedescriptor import ShapeDescriptor, DescriptorIndex, shape_differences, hue_differences
+
+
+def random_contours(rng, n):
+    contours = []
+    for _ in range(n):
+        sides = rng.integers(3, 9)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, sides))
+        radii = rng.uniform(10, 60, sides)
+        pts = 100 + np.stack((radii * np.cos(angles), radii * np.sin(angles)), axis=1)
+        contours.append(np.round(pts).astype(np.int32).reshape(-1, 1, 2))
+    return contours
+
+
+def hu_moments(cnt):
+    return cv2.HuMoments(cv2.moments(cnt)).flatten()
+
+
+# The vectorized I1 metric has to equal cv2.matchShapes (capped at 1, as used by the tracker)
+def test_shape_differences_match_cv2():
+    rng = np.random.default_rng(0)
+    contours = random_contours(rng, 30)
+    hu = np.array([hu_moments(c) for c in contours])
+    differences = shape_differences(hu, hu[::-1])
+    for i, a in enumerate(contours):
+        for j, b in enumerate(contours[::-1]):
+            expected = min(cv2.matchShapes(a, b, cv2.CONTOURS_MATCH_I1, 0), 1)
+            assert np.isclose(differences[i, j], expected, rtol=1e-9, atol=1e-12)
+
+
+def test_shape_differences_of_degenerate_contour():
+    square = np.array([[[0, 0]], [[40, 0]], [[40, 40]], [[0, 40]]], np.int32)
+    line = np.array([[[0, 0]], [[40, 0]]], np.int32)
+    differences = shape_differences(np.array([hu_moments(square)]), np.array([hu_moments(line)]))
+    assert differences[0, 0] == min(cv2.matchShapes(square, line, cv2.CONTOURS_MATCH_I1, 0), 1)
+
+
+def test_hue_differences_wrap_around():
+    differences = hue_differences(np.array([10.0, 350.0]), np.array([350.0, 180.0]))
+    np.testing.assert_allclose(differences, [[20 / 360, 170 / 360], [0, 170 / 360]])
+
+
+def test_descriptor_index_save_and_load(tmp_path):
+    rng = np.random.default_rng(1)
+    index = DescriptorIndex()
+    for key, cnt in zip(['play', 'pause', 'next'], random_contours(rng, 3)):
+        moments = cv2.moments(cnt)
+        index.add(key, ShapeDescriptor.from_contour(cnt, moments, (int(rng.integers(0, 180)), 200, 200)))
+    filename = str(tmp_path / 'library' / 'shapes.npz')
+    index.save(filename)
+
+    loaded = DescriptorIndex.load(filename)
+    assert loaded.keys == index.keys
+    for a, b in zip(loaded.descriptors, index.descriptors):
+        np.testing.assert_array_equal(a.to_array(), b.to_array())
+    for a, b in zip(loaded.differences(index.descriptors), index.differences(index.descriptors)):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_descriptor_index_load_missing_file(tmp_path):
+    assert len(DescriptorIndex.load(str(tmp_path / 'missing.npz'))) == 0
@@ -0,0 +1,50 @@
+import itertools
+import numpy as np
+
+from shapetracker import ShapeTracker
+
+assign = ShapeTracker._ShapeTracker__assign
+
+
+def key_of(costs, pairs):
+    return -len(pairs), sum(costs[i, j] for i, j in pairs)
+
+
+# Key of the best assignment by brute force: as many allowed pairs as possible, then the lowest total cost
+def brute_force_key(costs):
+    n_rows, n_cols = costs.shape
+    best_key = None
+    for k in range(min(n_rows, n_cols) + 1):
+        for rows in itertools.combinations(range(n_rows), k):
+            for cols in itertools.permutations(range(n_cols), k):
+                pairs = [(i, j) for i, j in zip(rows, cols) if np.isfinite(costs[i, j])]
+                key = key_of(costs, pairs)
+                if best_key is None or key < best_key:
+                    best_key = key
+    return best_key
+
+
+def test_assign_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        costs = rng.random((rng.integers(1, 5), rng.integers(1, 5)))
+        costs[rng.random(costs.shape) < 0.4] = np.inf
+        pairs = assign(costs)
+        assert all(np.isfinite(costs[i, j]) for i, j in pairs)
+        assert pairs == sorted(pairs)
+        assert len(set(i for i, _ in pairs)) == len(pairs) and len(set(j for _, j in pairs)) == len(pairs)
+        expected = brute_force_key(costs)
+        assert key_of(costs, pairs)[0] == expected[0]
+        assert np.isclose(key_of(costs, pairs)[1], expected[1])
+
+
+def test_assign_prefers_more_pairs_over_lower_cost():
+    # Matching row 0 with column 0 is cheapest, but would leave row 1 without its only allowed column
+    costs = np.array([[0.0, 0.9],
+                      [0.8, np.inf]])
+    assert assign(costs) == [(0, 1), (1, 0)]
+
+
+def test_assign_nothing_allowed():
+    assert assign(np.full((2, 3), np.inf)) == []
+    assert assign(np.zeros((0, 3))) == []
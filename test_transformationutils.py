@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+import extensions
+extensions.prepare(False)  # Loads the pure Python version if transformationutils is not compiled
+import transformationutils as tu
+
+
+def rectangle_masks(rng, shape=(240, 320)):
+    img1 = np.zeros(shape, np.uint8)
+    img2 = np.zeros(shape, np.uint8)
+    w, h = map(float, rng.integers(20, 80, 2))
+    angle = rng.uniform(0, 360)
+    cv2.fillConvexPoly(img1, cv2.boxPoints(((160.0, 120.0), (w, h), angle)).astype(np.int32), 255)
+    cv2.fillConvexPoly(img2, cv2.boxPoints(((165.0, 117.0), (w, h), angle + rng.uniform(-9, 9))).astype(np.int32), 255)
+    return img1, img2
+
+
+# XOR count of a single angle, computed on full images with cv2.getRotationMatrix2D (via rotate_points)
+def reference_score(pixels1, pixels2, centroid, angle, shape):
+    rotated = tu.rotate_points(pixels1, centroid, angle)
+    valid = (rotated[:, 0] >= 0) & (rotated[:, 1] >= 0) & (rotated[:, 0] < shape[0]) & (rotated[:, 1] < shape[1])
+    img1 = np.zeros(shape, bool)
+    img1[rotated[valid, 0], rotated[valid, 1]] = True
+    img2 = np.zeros(shape, bool)
+    img2[pixels2[:, 0], pixels2[:, 1]] = True
+    return np.count_nonzero(img1 ^ img2)
+
+
+def test_score_angles_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        img1, img2 = rectangle_masks(rng)
+        pixels1 = tu.get_pixel_set(img1) + np.array([3, -4])
+        pixels2 = tu.get_pixel_set(img2)
+        centroid = tu.calculate_centroid_set(pixels2)
+        angles = rng.uniform(-20, 20, 7)
+        expected = [reference_score(pixels1, pixels2, centroid, a, img1.shape) for a in angles]
+        np.testing.assert_array_equal(tu.score_angles(pixels1, pixels2, centroid, angles, img1.shape), expected)
+
+
+def test_score_angles_drops_pixels_outside_of_the_image():
+    pixels1 = np.array([[0, 0], [0, 1], [5, 5]])
+    pixels2 = np.array([[5, 5]])
+    angles = np.array([0.0, 90.0])
+    expected = [reference_score(pixels1, pixels2, np.array([0.0, 0.0]), a, (8, 8)) for a in angles]
+    np.testing.assert_array_equal(tu.score_angles(pixels1, pixels2, np.array([0.0, 0.0]), angles, (8, 8)), expected)
+
+
+def test_get_pixel_set_matches_nonzero():
+    img = np.zeros((50, 60), np.uint8)
+    img[10:20, 30:35] = 255
+    img[40, 2] = 255
+    np.testing.assert_array_equal(tu.get_pixel_set(img), np.stack(np.nonzero(img), axis=1))
+    assert len(tu.get_pixel_set(np.zeros((5, 5), np.uint8))) == 0
+
+
+def test_coarse_to_fine_finds_the_minimum_of_unimodal_scores():
+    domain = np.linspace(-10, 10, 41)
+    for best in range(len(domain)):
+        index = tu.coarse_to_fine_min_search(lambda angles: np.abs(angles - domain[best]), domain)
+        assert index == best
+
+
+def test_coarse_to_fine_breaks_ties_towards_the_lowest_angle():
+    domain = np.linspace(-10, 10, 41)
+    assert tu.coarse_to_fine_min_search(lambda angles: np.zeros(len(angles)), domain) == 0
+
+
+# On real masks the search returns the exhaustive minimum around the best coarse angle, and the exhaustive minimum
+# over the whole domain in the vast majority of cases
+def test_best_transformation_against_exhaustive_search():
+    rng = np.random.default_rng(1)
+    global_minima = 0
+    for _ in range(30):
+        img1, img2 = rectangle_masks(rng)
+        starting_angle = float(rng.uniform(-3, 3))
+        translation, angle = tu.calculate_best_transformation_from_img(img1, img2, starting_angle)
+
+        pixels1 = tu.get_pixel_set(img1)
+        pixels2 = tu.get_pixel_set(img2)
+        centroid = tu.calculate_centroid_set(pixels2)
+        np.testing.assert_array_equal(translation, (centroid - tu.calculate_centroid_set(pixels1)).astype(int))
+        pixels1 = pixels1 + translation
+        domain = -starting_angle + np.linspace(-10, 10, 41)
+        scores = tu.score_angles(pixels1, pixels2, centroid, domain, img1.shape)
+
+        index = int(np.argmin(np.abs(domain + angle)))
+        assert np.isclose(domain[index], -angle)
+        coarse = np.arange(0, 41, 4)
+        best_coarse = coarse[np.argmin(scores[coarse])]
+        window = scores[max(0, best_coarse - 3):best_coarse + 4]
+        assert scores[index] == min(window.min(), scores[coarse].min())
+        global_minima += scores[index] == scores.min()
+    assert global_minima >= 27
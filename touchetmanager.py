@@ -18,6 +18,7 @@ class TouchetManager(Publisher):
     def __init__(self):
         super().__init__()
         self.touchets = []
+        self.send_events = True  # Set to False to stop sending events to the event sink (e.g. for benchmarks)
 
     # Call this to start an asynchonous process that will eventually instantiate the touchet
     def mktouchet(self, touchet_class):
@@ -37,6 +38,8 @@ class TouchetManager(Publisher):
         self.touchets = [t for t in self.touchets if t not in todel]
 
     def propagate_touchet_event(self, event, data):
+        if not self.send_events:
+            return
         try:
             r = requests.get(conf()['event_sink_url'], params={'event': event, **data})
             r.raise_for_status()
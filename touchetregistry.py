@@ -0,0 +1,32 @@
+import sys
+import importlib
+
+
+# All touchets that can be created from the menu. Their modules are only imported once a touchet of that type is
+# created, which keeps them out of the startup time.
+TOUCHET_MODULES = {
+    'TouchetB': 'touchet_b',
+    'TouchetHB': 'touchet_hb',
+    'TouchetPB': 'touchet_pb',
+    'TouchetPHB': 'touchet_phb',
+    'TouchetR': 'touchet_r',
+    'TouchetS': 'touchet_s',
+    'TouchetUS': 'touchet_us',
+    'TouchetT': 'touchet_t',
+    'TouchetFS': 'touchet_fs',
+    'Touchet2T': 'touchet_2t',
+    'Touchet2FS': 'touchet_2fs',
+    'TouchetSB': 'touchet_sb',
+    'TouchetCS': 'touchet_cs',
+}
+
+
+def touchet_class(name):
+    return getattr(importlib.import_module(TOUCHET_MODULES[name]), name)
+
+
+# Like isinstance(touchet, <class called name>), but without importing the touchet's module. If it has not been
+# imported yet, no touchet of that type can exist.
+def is_touchet(touchet, name):
+    module = sys.modules.get(TOUCHET_MODULES[name])
+    return module is not None and isinstance(touchet, getattr(module, name))
@@ -2,13 +2,6 @@ import numpy as np
 import cv2
 
 
-# Private variables used for angle evaluation in calculate_best_transformation_from_img
-ae_pixels1 = None
-ae_pixels2 = None
-ae_centroid = None
-ae_shape = None
-
-
 # Used in shape.py
 def calculate_centroid(points):
     moments = cv2.moments(points)  # Calculate moments
@@ -25,58 +18,69 @@ def calculate_centroid_set(points):
 
 
 def rotate_points(points, pivot, angle):
-    rotation_matrix = cv2.getRotationMatrix2D(tuple(pivot), angle, 1)
+    rotation_matrix = cv2.getRotationMatrix2D(tuple(map(float, pivot)), angle, 1)  # OpenCV only takes Python numbers
     concat_pixels = np.concatenate((points, np.ones((points.shape[0], 1))), axis=1)
     return rotation_matrix.dot(concat_pixels.T).T.astype(int)
 
 
 def get_pixel_set(img):
-    x, y = np.nonzero(img)
-    return np.stack((x, y), axis=1)
+    x, y, w, h = cv2.boundingRect(img)  # Only look at the part of the image that contains pixels
+    rows, cols = np.nonzero(img[y:y + h, x:x + w])
+    return np.stack((rows + y, cols + x), axis=1)
 
 
 def linear_min_search(f, domain):
     return domain[np.argmin(list(f(domain)))]
 
 
-def ternary_min_search(f, domain):
-    length = len(domain)
-    if length <= 3:
-        min_index = np.argmin(f(domain))
-        return domain[min_index]
-    low = int(length / 3)
-    high = int(2 * length / 3)
-    low_score = f(domain[low])
-    high_score = f(domain[high])
-    if low_score < high_score:
-        return ternary_min_search(f, domain[:high])
-    else:
-        return ternary_min_search(f, domain[(low + 1):])
-
-
-def angle_mapper(angle):
-    # Rotate white pixels
-    rotation_matrix = cv2.getRotationMatrix2D(tuple(ae_centroid), angle, 1)
-    concat_pixels = np.concatenate((ae_pixels1, np.ones((ae_pixels1.shape[0], 1))), axis=1)
-    candidate = rotation_matrix.dot(concat_pixels.T).T.astype(int)
-
-    # Remove invalid indices
-    global ae_pixels2
-    candidate = candidate[(candidate[:, 0] >= 0) &
-                          (candidate[:, 1] >= 0) &
-                          (candidate[:, 0] < ae_shape[0]) &
-                          (candidate[:, 1] < ae_shape[1])]
-    ae_pixels2 = ae_pixels2[(ae_pixels2[:, 0] >= 0) &
-                            (ae_pixels2[:, 1] >= 0) &
-                            (ae_pixels2[:, 0] < ae_shape[0]) &
-                            (ae_pixels2[:, 1] < ae_shape[1])]
-
-    # xor and count
-    img1 = np.zeros(ae_shape, np.uint8)
-    img1[tuple(candidate.T)] = 255
-    img2 = np.zeros(ae_shape, np.uint8)
-    img2[tuple(ae_pixels2.T)] = 255
-    return np.count_nonzero(cv2.bitwise_xor(img1, img2))
+# Number of differing pixels between the pixel set 1 rotated by each of the angles around centroid (as
+# cv2.getRotationMatrix2D would, rounding towards zero) and the pixel set 2. All sets are given as (row, col) arrays.
+# Rotated pixels outside of the image (of the given shape) are dropped. The angles are scored all at once on the
+# bounding box of the pixels: each angle gets a row of an occupancy array of the box, so that pixels landing on the same
+# position are counted once.
+def score_angles(pixels1, pixels2, centroid, angles, shape):
+    radians = np.deg2rad(angles)[:, None]
+    alpha = np.cos(radians)
+    beta = np.sin(radians)
+    x = pixels1[:, 0].astype(np.float64)
+    y = pixels1[:, 1].astype(np.float64)
+    rows = (alpha * x + beta * y + ((1 - alpha) * centroid[0] - beta * centroid[1])).astype(int)
+    cols = (-beta * x + alpha * y + (beta * centroid[0] + (1 - alpha) * centroid[1])).astype(int)
+    valid = (rows >= 0) & (cols >= 0) & (rows < shape[0]) & (cols < shape[1])
+
+    # Bounding box of all (valid) rotated pixels and pixel set 2
+    top = min(rows.min(initial=shape[0], where=valid), pixels2[:, 0].min(initial=shape[0]))
+    left = min(cols.min(initial=shape[1], where=valid), pixels2[:, 1].min(initial=shape[1]))
+    bottom = max(rows.max(initial=-1, where=valid), pixels2[:, 0].max(initial=-1)) + 1
+    right = max(cols.max(initial=-1, where=valid), pixels2[:, 1].max(initial=-1)) + 1
+    if bottom <= top or right <= left:
+        return np.zeros(len(angles), int)
+    w = right - left
+    size = (bottom - top) * w
+
+    # Invalid pixels go to an extra position past the box, which is not counted
+    occupied = np.zeros((len(angles), size + 1), bool)
+    occupied[np.arange(len(angles))[:, None], np.where(valid, (rows - top) * w + (cols - left), size)] = True
+    occupied = occupied[:, :size]
+    target = np.zeros(size, bool)
+    target[(pixels2[:, 0] - top) * w + (pixels2[:, 1] - left)] = True
+
+    # |A xor B| = |A| + |B| - 2 |A and B|
+    return np.count_nonzero(occupied, axis=1) + np.count_nonzero(target) - 2 * np.count_nonzero(occupied & target, axis=1)
+
+
+# Index of the best scoring angle of the domain: first every coarse_stride-th angle is scored, then the angles around
+# the best of them. Unlike a ternary search, this does not assume that the score has a single minimum in the domain.
+def coarse_to_fine_min_search(score, domain, coarse_stride=4):
+    coarse = np.arange(0, len(domain), coarse_stride)
+    coarse_scores = score(domain[coarse])
+    best = coarse[np.argmin(coarse_scores)]
+    fine = np.arange(max(0, best - coarse_stride + 1), min(len(domain), best + coarse_stride))
+    fine_scores = score(domain[fine])
+    candidates = np.concatenate((coarse, fine))
+    scores = np.concatenate((coarse_scores, fine_scores))
+    order = np.lexsort((candidates, scores))  # Lowest score, ties go to the lowest angle
+    return candidates[order[0]]
 
 
 # Used in shape.py
@@ -100,24 +104,14 @@ def calculate_best_transformation_from_img(img1, img2, starting_angle):
     # Calculate translation
     centroid_1 = calculate_centroid_set(pixels_1)
     centroid_2 = calculate_centroid_set(pixels_2)
-    best_translation = (centroid_2 - centroid_1).astype(np.int)
+    best_translation = (centroid_2 - centroid_1).astype(int)
 
     # Apply translation to pixel set 1
     pixels_1 = pixels_1 + best_translation
 
     # Find the best rotation
     search_domain = -starting_angle + np.linspace(-10, 10, 41)
+    best_index = coarse_to_fine_min_search(lambda angles: score_angles(pixels_1, pixels_2, centroid_2, angles, img1.shape),
+                                           search_domain)
 
-    # Ternary search
-    global ae_pixels1
-    global ae_pixels2
-    global ae_centroid
-    global ae_shape
-    ae_pixels1 = pixels_1
-    ae_pixels2 = pixels_2
-    ae_centroid = centroid_2
-    ae_shape = img1.shape
-    angle_mapper_npfunc = np.frompyfunc(angle_mapper, 1, 1)
-    best_angle = ternary_min_search(angle_mapper_npfunc, search_domain)
-
-    return best_translation, -best_angle
+    return best_translation, -search_domain[best_index]
@@ -14,19 +14,7 @@ from touchetmanager import touchetmanager
 
 from shapepicker import shapepicker
 
-from touchet_b import TouchetB
-from touchet_hb import TouchetHB
-from touchet_pb import TouchetPB
-from touchet_phb import TouchetPHB
-from touchet_r import TouchetR
-from touchet_s import TouchetS
-from touchet_us import TouchetUS
-from touchet_t import TouchetT
-from touchet_fs import TouchetFS
-from touchet_2t import Touchet2T
-from touchet_2fs import Touchet2FS
-from touchet_sb import TouchetSB
-from touchet_cs import TouchetCS
+from touchetregistry import touchet_class
 
 
 __ui_instance = None
@@ -43,25 +31,26 @@ class UI(Publisher):
     def __init__(self):
         super().__init__()
         self.finger_down_ts = 0
+        self.menu_square = int(round(realsensecam().scale_px(50)))  # Size of the squares in the top corners opening the menus
 
         self.menu_active = False
         self.menu_armed = False
         self.menu_progress = 0
         self.menu = Menu((100, 20, 0))
         self.menu.add_item(0, 1, 'Exit menu', self.__menu_close)
-        self.menu.add_item(0, 5, 'Create CS touchet', self.create_touchet, TouchetCS)
-        self.menu.add_item(1, 0, 'Create B touchet', self.create_touchet, TouchetB)
-        self.menu.add_item(1, 1, 'Create HB touchet', self.create_touchet, TouchetHB)
-        self.menu.add_item(1, 2, 'Create PB touchet', self.create_touchet, TouchetPB)
-        self.menu.add_item(1, 3, 'Cr. PHB touchet', self.create_touchet, TouchetPHB)
-        self.menu.add_item(1, 4, 'Cr. SB touchet', self.create_touchet, TouchetSB)
-        self.menu.add_item(1, 5, 'Create R touchet', self.create_touchet, TouchetR)
-        self.menu.add_item(2, 0, 'Create S touchet', self.create_touchet, TouchetS)
-        self.menu.add_item(2, 1, 'Create US touchet', self.create_touchet, TouchetUS)
-        self.menu.add_item(2, 2, 'Create T touchet', self.create_touchet, TouchetT)
-        self.menu.add_item(2, 3, 'Create FS touchet', self.create_touchet, TouchetFS)
-        self.menu.add_item(2, 4, 'Create 2T touchet', self.create_touchet, Touchet2T)
-        self.menu.add_item(2, 5, 'Cr. 2FS touchet', self.create_touchet, Touchet2FS)
+        self.menu.add_item(0, 5, 'Create CS touchet', self.create_touchet, 'TouchetCS')
+        self.menu.add_item(1, 0, 'Create B touchet', self.create_touchet, 'TouchetB')
+        self.menu.add_item(1, 1, 'Create HB touchet', self.create_touchet, 'TouchetHB')
+        self.menu.add_item(1, 2, 'Create PB touchet', self.create_touchet, 'TouchetPB')
+        self.menu.add_item(1, 3, 'Cr. PHB touchet', self.create_touchet, 'TouchetPHB')
+        self.menu.add_item(1, 4, 'Cr. SB touchet', self.create_touchet, 'TouchetSB')
+        self.menu.add_item(1, 5, 'Create R touchet', self.create_touchet, 'TouchetR')
+        self.menu.add_item(2, 0, 'Create S touchet', self.create_touchet, 'TouchetS')
+        self.menu.add_item(2, 1, 'Create US touchet', self.create_touchet, 'TouchetUS')
+        self.menu.add_item(2, 2, 'Create T touchet', self.create_touchet, 'TouchetT')
+        self.menu.add_item(2, 3, 'Create FS touchet', self.create_touchet, 'TouchetFS')
+        self.menu.add_item(2, 4, 'Create 2T touchet', self.create_touchet, 'Touchet2T')
+        self.menu.add_item(2, 5, 'Cr. 2FS touchet', self.create_touchet, 'Touchet2FS')
 
         self.action_menu_active = False
         self.action_menu_armed = False
@@ -88,7 +77,7 @@ class UI(Publisher):
             self.menu.on_finger_pressing(xy)
         elif self.action_menu_active:
             self.action_menu.on_finger_pressing(xy)
-        elif 50 <= xy[0] <= realsensecam().W - 50 or xy[1] >= 50:
+        elif self.menu_square <= xy[0] <= realsensecam().W - self.menu_square or xy[1] >= self.menu_square:
             self.on_finger_up(None, data)
         elif self.menu_armed:
             self.menu_progress = min(1, time.time() - self.finger_down_ts)
@@ -103,11 +92,11 @@ class UI(Publisher):
 
     def on_finger_down(self, _, data):
         xy = data['fingertip_pos']
-        if xy[1] < 50:
-            if xy[0] < 50:
+        if xy[1] < self.menu_square:
+            if xy[0] < self.menu_square:
                 self.menu_armed = True
                 self.finger_down_ts = time.time()
-            elif xy[0] > realsensecam().W - 50:
+            elif xy[0] > realsensecam().W - self.menu_square:
                 self.action_menu_armed = True
                 self.finger_down_ts = time.time()
 
@@ -122,8 +111,8 @@ class UI(Publisher):
         self.action_menu_progress = 0
 
     def visualize_menu(self, visualizer):
-        visualizer.frame[0:50, 0:50] = (100, 20, 0)
-        visualizer.frame[0:50, -50:] = (0, 120, 0)
+        visualizer.frame[0:self.menu_square, 0:self.menu_square] = (100, 20, 0)
+        visualizer.frame[0:self.menu_square, -self.menu_square:] = (0, 120, 0)
         if self.menu_active:
             self.menu.visualize(visualizer)
         elif self.menu_armed:
@@ -135,9 +124,9 @@ class UI(Publisher):
             bg = np.full_like(visualizer.frame, (0, 120, 0))
             visualizer.frame = cv2.addWeighted(visualizer.frame, 1 - .8 * self.action_menu_progress, bg, self.action_menu_progress * 1, 0)
 
-    def create_touchet(self, touchet_class):
+    def create_touchet(self, touchet_name):
         self.__menu_close()
-        touchetmanager().mktouchet(touchet_class)
+        touchetmanager().mktouchet(touchet_class(touchet_name))
 
     def __menu_open(self):
         self.menu_active = True
@@ -176,3 +165,4 @@ class UI(Publisher):
 
     def __set_shape_action_callback(self, shape, action):
         shape.action_name = action
+        shapetracker().remember_shape(shape)
@@ -9,13 +9,11 @@ from shapetracker import shapetracker
 from touchedshapetracker import touchedshapetracker
 from shapepicker import shapepicker
 from touchetmanager import touchetmanager
-from touchet_s import TouchetS
-from touchet_us import TouchetUS
-from touchet_sb import TouchetSB
-from touchet_cs import TouchetCS
+from touchetregistry import is_touchet
 from shaperegionpicker import shaperegionpicker
 from shapepositionpicker import shapepositionpicker
 from ui import ui
+from scheduler import scheduler
 from bbox import Bbox
 import icp
 
@@ -145,17 +143,17 @@ class Visualizer:
         for touchet in touchetmanager().touchets:
             for shape in touchet.shapes:
                 cv2.putText(self.frame, type(touchet).__name__, (shape.bbox.x, shape.bbox.y2), cv2.FONT_HERSHEY_COMPLEX_SMALL, self.text_size, (150, 150, 150))
-            if isinstance(touchet, TouchetS):
+            if is_touchet(touchet, 'TouchetS'):
                 pts = touchet.shapes[1].keypoints[touchet]
                 cv2.line(self.frame, tuple(pts[0]), tuple(pts[1]), (0, 255, 0))
-            if isinstance(touchet, TouchetSB):
+            if is_touchet(touchet, 'TouchetSB'):
                 pts = touchet.shapes[0].keypoints[touchet]
                 cv2.line(self.frame, tuple(touchet.shapes[0].bbox.center()), tuple(pts[0]), (0, 255, 0))
-            if isinstance(touchet, TouchetCS):
+            if is_touchet(touchet, 'TouchetCS'):
                 pts = touchet.shapes[1].keypoints[touchet]
                 cv2.line(self.frame, tuple(touchet.shapes[1].bbox.center()), tuple(pts[0]), (0, 255, 0))
                 cv2.line(self.frame, tuple(touchet.shapes[0].bbox.center()), tuple(touchet.shapes[1].bbox.center()), (0, 255, 0))
-            if isinstance(touchet, TouchetUS):
+            if is_touchet(touchet, 'TouchetUS'):
                 cv2.circle(self.frame, tuple(touchet.shapes[1].bbox.center_nparr().astype(int)), int(touchet.min_dist), (0, 255, 0))
 
     def __stats(self):
@@ -168,6 +166,9 @@ class Visualizer:
 
         self.__print("Tracking {:2d} shapes".format(len(shapetracker().shapes)), 2, self.text_l)
         self.__print("{:2d} FPS".format(self.fps), 2, self.text_r - 86)
+        # Activity state of the scheduler and the rates of shape detection / touched shape tracking / background update
+        self.__print("{} {}/{}/{} Hz".format(scheduler().state, *[scheduler().rate(stage) for stage in
+                                                                   ['shape_detection', 'touched_shape_tracking', 'background_update']]), 2, self.text_l + 230)
 
         if not handdetector().hand_valid:
             self.__print("HAND ERROR! Too many or too long hands.", 1, self.text_l, color=(0, 0, 255))